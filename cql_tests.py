@@ -7,13 +7,9 @@ import math
 from collections import OrderedDict
 from uuid import uuid4, UUID
 
-from thrift_bindings.v30.ttypes import CfDef, Mutation, ColumnOrSuperColumn, Column
-from thrift_bindings.v30.ttypes import ConsistencyLevel as ThriftConsistencyLevel
-
-from dtest import Tester, canReuseCluster, freshCluster
+from dtest import Tester, canReuseCluster, canPoolCluster, freshCluster
 from assertions import assert_invalid, assert_one, assert_none, assert_all
-from thrift_tests import get_thrift_client
-from tools import since, require, rows_to_list
+from tools import since, require, rows_to_list, get_thrift_client
 from cassandra import ConsistencyLevel, InvalidRequest, AlreadyExists
 from cassandra.concurrent import execute_concurrent_with_args
 from cassandra.protocol import ProtocolException, SyntaxException, ConfigurationException, InvalidRequestException
@@ -24,6 +20,7 @@ cql_version = "3.0.0"
 
 
 @canReuseCluster
+@canPoolCluster
 class TestCQL(Tester):
 
     def prepare(self, ordered=False, create_keyspace=True, use_cache=False, nodes=1, rf=1):
@@ -35,8 +32,7 @@ class TestCQL(Tester):
         if (use_cache):
             cluster.set_configuration_options(values={'row_cache_size_in_mb': 100})
 
-        if not cluster.nodelist():
-            cluster.populate(nodes).start()
+        cluster = self.lease_cluster(nodes)
         node1 = cluster.nodelist()[0]
         time.sleep(0.2)
 
@@ -1712,6 +1708,9 @@ class TestCQL(Tester):
 
     def cql3_insert_thrift_test(self):
         """ Check that we can insert from thrift into a CQL3 table (#4377) """
+        from thrift_bindings.v30.ttypes import Mutation, ColumnOrSuperColumn, Column
+        from thrift_bindings.v30.ttypes import ConsistencyLevel as ThriftConsistencyLevel
+
         cursor = self.prepare()
 
         cursor.execute("""
@@ -3068,6 +3067,8 @@ class TestCQL(Tester):
 
     @since('2.0')
     def rename_test(self):
+        from thrift_bindings.v30.ttypes import CfDef
+
         cursor = self.prepare()
 
         node = self.cluster.nodelist()[0]
@@ -1,5 +1,7 @@
+import hashlib
 import re
-from cassandra.concurrent import execute_concurrent_with_args
+import threading
+from itertools import islice
 
 
 def strip(val):
@@ -39,6 +41,19 @@ def row_has_multiplier(row):
     return False
 
 
+def cells_into_dict(row_cells, headers, format_funcs=None):
+    row_map = dict(zip(headers, row_cells))
+
+    if format_funcs:
+        for colname, value in row_map.items():
+            func = format_funcs.get(colname)
+
+            if func is not None:
+                row_map[colname] = func(value)
+
+    return row_map
+
+
 def parse_row_into_dict(row, headers, format_funcs=None):
     row_cells = [l.strip() for l in row.split('|')]
 
@@ -53,42 +68,302 @@ def parse_row_into_dict(row, headers, format_funcs=None):
             )
         return multirows
 
-    row_map = dict(zip(headers, row_cells))
+    return cells_into_dict(row_cells, headers, format_funcs=format_funcs)
 
-    if format_funcs:
-        for colname, value in row_map.items():
-            func = format_funcs.get(colname)
 
-            if func is not None:
-                row_map[colname] = func(value)
+def iter_data_dicts(data, format_funcs=None):
+    """
+    Like parse_data_into_dicts, but yields the rows one at a time: a *N row
+    is only split once, and its N copies are formatted as they are consumed.
+    """
+    # throw out leading/trailing space and pipes
+    # so we can split on the data without getting
+    # extra empty fields, and skip empty lines
+    rows = (row for row in (strip(line) for line in data.split('\n')) if row)
 
-    return row_map
+    headers = parse_headers_into_list(next(rows))
+
+    for row in rows:
+        row_multiplier = get_row_multiplier(row)
+        row_cells = [l.strip() for l in row.split('|')]
+
+        if row_multiplier is None:
+            yield cells_into_dict(row_cells, headers, format_funcs=format_funcs)
+        else:
+            for i in xrange(row_multiplier):
+                yield cells_into_dict(row_cells[1:], headers, format_funcs=format_funcs)
 
 
 def parse_data_into_dicts(data, format_funcs=None):
-    # throw out leading/trailing space and pipes
-    # so we can split on the data without getting
-    # extra empty fields
-    rows = map(strip, data.split('\n'))
+    return list(iter_data_dicts(data, format_funcs=format_funcs))
 
-    # remove any remaining empty lines (i.e. '') from data
-    rows = filter(None, rows)
 
-    # remove headers
-    headers = parse_headers_into_list(rows.pop(0))
+ROW_HASH_MASK = (1 << 64) - 1
 
-    values = []
 
-    for row in rows:
-        if row_has_multiplier(row):
-            values.extend(parse_row_into_dict(row, headers, format_funcs=format_funcs))
-        else:
-            values.append(parse_row_into_dict(row, headers, format_funcs=format_funcs))
+def canonical_value(value):
+    """
+    A form of value whose repr() is the same for equal values and differs
+    for values of different types: str and unicode, and int and long, are
+    made the same, and maps and sets are sorted so that their order doesn't
+    matter.
+    """
+    if isinstance(value, str):
+        return value.decode('utf-8', 'replace')
+    if isinstance(value, (int, long)) and not isinstance(value, bool):
+        return long(value)
+    if hasattr(value, 'items'):
+        return ('map', sorted((canonical_value(k), canonical_value(v)) for k, v in value.items()))
+    if isinstance(value, (set, frozenset)) or hasattr(value, 'isdisjoint'):
+        return ('set', sorted(canonical_value(v) for v in value))
+    if isinstance(value, list):
+        return [canonical_value(v) for v in value]
+    if isinstance(value, tuple):
+        return tuple(canonical_value(v) for v in value)
+    return value
+
+
+def row_hash(row):
+    """
+    Hashes a row to a 64-bit int. A row is a dict, hashed by the repr of its
+    canonical_value() so that values of different types (1 and u'1') don't
+    match, or a string as made by flatten(), which only matches other strings.
+    """
+    if isinstance(row, basestring):
+        text = u'flat:' + canonical_value(row)
+    else:
+        text = u'row:' + repr(canonical_value(row)).decode('utf-8', 'replace')
+    return int(hashlib.md5(text.encode('utf-8')).hexdigest()[:16], 16)
+
+
+class RowDigest(object):
+    """
+    Order-independent digest of a multiset of rows: their count, and the sum
+    and the xor of their row_hash()es. The sum makes duplicate rows count,
+    the xor makes a collision need more than a matching sum. Equal multisets
+    have equal digests, whatever order the rows are added in.
+    """
+
+    def __init__(self, rows=()):
+        self.count = 0
+        self.sum = 0
+        self.xor = 0
+        for row in rows:
+            self.add(row)
+
+    def add(self, row):
+        h = row_hash(row)
+        self.count += 1
+        self.sum = (self.sum + h) & ROW_HASH_MASK
+        self.xor ^= h
+
+    def __eq__(self, other):
+        return (self.count, self.sum, self.xor) == (other.count, other.sum, other.xor)
+
+    def __ne__(self, other):
+        return not self == other
 
-    return values
+    def __repr__(self):
+        return 'RowDigest(count=%d, sum=%016x, xor=%016x)' % (self.count, self.sum, self.xor)
 
 
-def create_rows(data, cursor, table_name, cl=None, format_funcs=None, prefix='', postfix=''):
+def diff_rows(actual, expected, limit=10):
+    """
+    Returns (missing, unexpected): the first `limit` rows of expected that
+    actual lacks, and of actual that expected lacks, counting duplicates.
+    Both are read twice, and a count per distinct row hash is kept, so this
+    is for reporting a mismatch that compare_rows() found.
+    """
+    # row hash -> expected count minus actual count
+    counts = {}
+    for row in expected:
+        h = row_hash(row)
+        counts[h] = counts.get(h, 0) + 1
+    for row in actual:
+        h = row_hash(row)
+        counts[h] = counts.get(h, 0) - 1
+
+    def first(rows, sign):
+        found = []
+        for row in rows:
+            if len(found) >= limit:
+                break
+            h = row_hash(row)
+            if counts.get(h, 0) * sign > 0:
+                counts[h] -= sign
+                found.append(row)
+        return found
+
+    missing = first(expected, 1)
+    unexpected = first(actual, -1)
+    return missing, unexpected
+
+
+def compare_rows(actual, expected, limit=10):
+    """
+    Compares two collections of rows as multisets (order doesn't matter,
+    duplicates do) in linear time, by their RowDigest. Returns None if they
+    are equal, or else a description of the first `limit` differing rows,
+    for which actual and expected must be iterable more than once.
+    """
+    actual_digest, expected_digest = RowDigest(actual), RowDigest(expected)
+    if actual_digest == expected_digest:
+        return None
+
+    missing, unexpected = diff_rows(actual, expected, limit=limit)
+    lines = ["got %d rows, expected %d" % (actual_digest.count, expected_digest.count)]
+    if missing:
+        lines.append("missing (first %d):" % len(missing))
+        lines.extend("  %r" % (row,) for row in missing)
+    if unexpected:
+        lines.append("unexpected (first %d):" % len(unexpected))
+        lines.extend("  %r" % (row,) for row in unexpected)
+    return '\n'.join(lines)
+
+
+class CreatedRows(object):
+    """
+    What create_rows() wrote: `count` rows with the given `digest`, readable
+    as a sequence of dicts (len, iteration, reversal, indexing, slicing and
+    comparing equal to a list of the same rows) like the list create_rows()
+    used to return.
+
+    Rows are kept as tuples of values in `headers` order. With regenerate,
+    they aren't kept at all and every pass parses the table again, which is
+    only right if the format_funcs are deterministic: a full pass whose rows
+    don't match the digest raises an AssertionError.
+    """
+
+    def __init__(self, headers, data=None, format_funcs=None):
+        self.headers = headers
+        self.digest = RowDigest()
+        # the table to regenerate rows from, or None if rows are kept
+        self.__data = data
+        self.__format_funcs = format_funcs
+        self.__values = [] if data is None else None
+        # rows appended after creation, e.g. written by the test itself
+        self.__extra = []
+
+    @property
+    def count(self):
+        return self.digest.count
+
+    def _created(self, row):
+        self.digest.add(row)
+        if self.__values is not None:
+            self.__values.append(tuple(row[h] for h in self.headers))
+
+    def append(self, row):
+        self.digest.add(row)
+        self.__extra.append(row)
+
+    def __len__(self):
+        return self.digest.count
+
+    def __iter__(self):
+        if self.__values is not None:
+            for values in self.__values:
+                yield dict(zip(self.headers, values))
+        else:
+            regenerated = RowDigest()
+            for row in iter_data_dicts(self.__data, format_funcs=self.__format_funcs):
+                regenerated.add(row)
+                yield row
+            for row in self.__extra:
+                regenerated.add(row)
+            assert regenerated == self.digest, \
+                "Regenerated rows don't match the rows created (%r, expected %r), are the format_funcs deterministic?" % (regenerated, self.digest)
+        for row in self.__extra:
+            yield row
+
+    def __reversed__(self):
+        if self.__values is None:
+            return reversed(list(self))
+        return self.__reversed_kept()
+
+    def __reversed_kept(self):
+        for row in reversed(self.__extra):
+            yield row
+        for values in reversed(self.__values):
+            yield dict(zip(self.headers, values))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step < 0:
+                return list(self)[index]
+            return list(islice(self, start, stop, step))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('row index out of range')
+        if self.__values is not None:
+            if index < len(self.__values):
+                return dict(zip(self.headers, self.__values[index]))
+            return self.__extra[index - len(self.__values)]
+        return next(islice(self, index, None))
+
+    def __eq__(self, other):
+        """Compares equal to any sequence of the same rows, in the same order."""
+        if not isinstance(other, (CreatedRows, list, tuple)):
+            return NotImplemented
+        return len(self) == len(other) and list(self) == list(other)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '<CreatedRows %s, columns %s>' % (self.digest, ', '.join(self.headers))
+
+
+def execute_bounded(cursor, statements_and_parameters, concurrency=100):
+    """
+    Executes each (statement, parameters) pair of statements_and_parameters,
+    which can be any iterable and is consumed as requests are sent, with at
+    most concurrency requests in flight. Stops sending at the first error,
+    and raises it once the requests in flight are done.
+    """
+    slots = threading.Semaphore(concurrency)
+    errors = []
+
+    def done(result):
+        slots.release()
+
+    def failed(exc):
+        errors.append(exc)
+        slots.release()
+
+    try:
+        for statement, values in statements_and_parameters:
+            slots.acquire()
+            if errors:
+                slots.release()
+                break
+            try:
+                cursor.execute_async(statement, values).add_callbacks(done, failed)
+            except Exception:
+                slots.release()
+                raise
+    finally:
+        # wait for the requests in flight
+        for i in xrange(concurrency):
+            slots.acquire()
+
+    if errors:
+        raise errors[0]
+
+
+def execute_with_args_bounded(cursor, statement, parameters, concurrency=100):
+    """
+    Executes statement once for each item of parameters, see execute_bounded().
+    """
+    execute_bounded(cursor, ((statement, values) for values in parameters), concurrency=concurrency)
+
+
+def create_rows(data, cursor, table_name, cl=None, format_funcs=None, prefix='', postfix='', concurrency=100, regenerate=False):
     """
     Creates db rows using given cursor, with table name provided,
     using data formatted like:
@@ -99,27 +374,32 @@ def create_rows(data, cursor, table_name, cl=None, format_funcs=None, prefix='',
     format_funcs should be a dictionary of {columnname: function} if data needs to be formatted
     before being included in CQL.
 
-    Returns a list of maps describing the data created.
+    Rows are parsed, formatted and inserted as a stream, with at most
+    concurrency inserts in flight, so *N rows are never all in memory.
+
+    Returns a CreatedRows describing the data created. With regenerate (for
+    deterministic format_funcs only) it keeps no rows, just their count and
+    digest, and parses the table again when the rows are read.
     """
-    values = []
-    dicts = parse_data_into_dicts(data, format_funcs=format_funcs)
+    headers = parse_headers_into_list(data)
+    created = CreatedRows(headers, data=data if regenerate else None, format_funcs=format_funcs)
 
-    # use the first dictionary to build a prepared statement for all
     prepared = cursor.prepare(
         "{prefix} INSERT INTO {table} ({cols}) values ({vals}) {postfix}".format(
-            prefix=prefix, table=table_name, cols=', '.join(dicts[0].keys()),
-            vals=', '.join('?' for k in dicts[0].keys()), postfix=postfix)
+            prefix=prefix, table=table_name, cols=', '.join(headers),
+            vals=', '.join('?' for h in headers), postfix=postfix)
     )
     if cl is not None:
         prepared.consistency_level = cl
 
-    query_results = execute_concurrent_with_args(cursor, prepared, [d.values() for d in dicts])
+    def parameters():
+        for row in iter_data_dicts(data, format_funcs=format_funcs):
+            created._created(row)
+            yield [row[h] for h in headers]
 
-    for i, (status, result_or_exc) in enumerate(query_results):
-        # should maybe check status here before appening to expected values
-        values.append(dicts[i])
+    execute_with_args_bounded(cursor, prepared, parameters(), concurrency=concurrency)
 
-    return values
+    return created
 
 
 def flatten_into_set(iterable):
@@ -3,7 +3,7 @@ from dtest import Tester
 import os, sys, time
 from ccmlib.cluster import Cluster
 from tools import require, since
-from jmxutils import make_mbean, JolokiaAgent
+from jmxutils import make_mbean, jolokia_agents
 
 
 class TestDeletion(Tester):
@@ -67,9 +67,6 @@ def memtable_count(node, keyspace, table):
 
 
 def columnfamily_metric(node, keyspace, table, name):
-    with JolokiaAgent(node) as jmx:
-        mbean = make_mbean('metrics', type='ColumnFamily',
-                           name=name, keyspace=keyspace, scope=table)
-        value = jmx.read_attribute(mbean, 'Value')
-
-    return value
+    mbean = make_mbean('metrics', type='ColumnFamily',
+                       name=name, keyspace=keyspace, scope=table)
+    return jolokia_agents.get(node).read_attribute(mbean, 'Value')
@@ -1,11 +1,16 @@
 from __future__ import with_statement
-import os, tempfile, sys, shutil, subprocess, types, time, threading, traceback, ConfigParser, logging, fnmatch, re, copy
+import os, tempfile, sys, shutil, subprocess, types, time, threading, traceback, ConfigParser, logging, fnmatch, re, copy, atexit, hashlib, socket, random, gzip, Queue, signal, errno, math
 
+import timings
+from resource_sampler import ResourceSampler
+from jmxutils import jolokia_agents
+from metrics_recorder import MetricsRecorder
 from ccmlib.cluster import Cluster
 from ccmlib.cluster_factory import ClusterFactory
 from ccmlib.node import Node
-from ccmlib.common import is_win
+from ccmlib.common import is_win, get_version_from_build, CCMError
 from uuid import UUID
+from distutils.version import LooseVersion
 from nose.exc import SkipTest
 from unittest import TestCase
 from cassandra.cluster import NoHostAvailable
@@ -13,15 +18,67 @@ from cassandra.cluster import Cluster as PyCluster
 from cassandra.auth import PlainTextAuthProvider
 from cassandra.policies import WhiteListRoundRobinPolicy
 
+# Several dtest processes can share a host as long as each one runs its
+# clusters in its own slot: slot K binds nodes to 127.0.K.x and shifts their
+# JMX and remote debug ports by K. WORKER_SLOT picks a slot explicitly,
+# PARALLEL_WORKERS makes every process (e.g. nosetests --processes workers)
+# claim the first free one.
+MAX_WORKER_SLOTS = 100
+PARALLEL_WORKERS = os.environ.get('PARALLEL_WORKERS', '').lower() in ('yes', 'true')
+_worker_slot_lock = None
+
+def claim_worker_slot():
+    global _worker_slot_lock
+    if 'WORKER_SLOT' in os.environ:
+        slot = int(os.environ['WORKER_SLOT'])
+        assert 0 <= slot < MAX_WORKER_SLOTS, "WORKER_SLOT must be in [0, %d)" % MAX_WORKER_SLOTS
+        return slot
+    if not PARALLEL_WORKERS or is_win():
+        return 0
+
+    import fcntl
+    lock_dir = os.path.join(tempfile.gettempdir(), 'dtest-worker-slots')
+    try:
+        os.mkdir(lock_dir)
+    except OSError:
+        pass
+    for slot in xrange(MAX_WORKER_SLOTS):
+        lock = open(os.path.join(lock_dir, 'slot-%d.lock' % slot), 'a')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            lock.close()
+            continue
+        # the lock is held, and the slot reserved, until this process exits
+        _worker_slot_lock = lock
+        return slot
+    raise RuntimeError("All %d dtest worker slots are in use" % MAX_WORKER_SLOTS)
+
+WORKER_SLOT = claim_worker_slot()
+IP_PREFIX = '127.0.%d.' % WORKER_SLOT
+
+def slot_suffix(name):
+    """Makes a per-process file name so that concurrent workers don't clobber each other."""
+    return name if WORKER_SLOT == 0 else '%s-%d' % (name, WORKER_SLOT)
+
+def slot_port(port):
+    """
+    Shifts a per-node port (JMX, remote debug) into this worker's port block.
+    A port of '0', which ccm uses for "disabled", is returned unchanged.
+    """
+    if not port or int(port) == 0:
+        return port
+    return str(int(port) + WORKER_SLOT)
+
 LOG_SAVED_DIR="logs"
-try:
-    os.mkdir(LOG_SAVED_DIR)
-except OSError:
-    pass
 
-LAST_LOG = os.path.join(LOG_SAVED_DIR, "last")
+LAST_LOG = os.path.join(LOG_SAVED_DIR, slot_suffix("last"))
 
-LAST_TEST_DIR='last_test_dir'
+LAST_TEST_DIR=slot_suffix('last_test_dir')
+
+PENDING_DELETES=slot_suffix('pending_deletes')
+
+TIMINGS_FILE = os.path.join(LOG_SAVED_DIR, slot_suffix("timings-%d" % time.time()) + ".jsonl")
 
 DEFAULT_DIR='./'
 config = ConfigParser.RawConfigParser()
@@ -40,37 +97,214 @@ OFFHEAP_MEMTABLES = os.environ.get('OFFHEAP_MEMTABLES', '').lower() in ('yes', '
 NUM_TOKENS = os.environ.get('NUM_TOKENS', '256')
 RECORD_COVERAGE = os.environ.get('RECORD_COVERAGE', '').lower() in ('yes', 'true')
 REUSE_CLUSTER = os.environ.get('REUSE_CLUSTER', '').lower() in ('yes', 'true')
+CLUSTER_POOL = os.environ.get('CLUSTER_POOL', '').lower() in ('yes', 'true')
+# 'yes'/'true' clones templates with reflinks where the filesystem supports
+# them, 'hardlink' hardlinks sstables (only safe if no test edits them in place)
+CLUSTER_TEMPLATES = os.environ.get('CLUSTER_TEMPLATES', '').lower()
+CLUSTER_TEMPLATE_DIR = os.path.expanduser(os.environ.get('CLUSTER_TEMPLATE_DIR', os.path.join(tempfile.gettempdir(), 'dtest-templates')))
 SILENCE_DRIVER_ON_SHUTDOWN = os.environ.get('SILENCE_DRIVER_ON_SHUTDOWN', 'true').lower() in ('yes', 'true')
+SESSION_CACHE = os.environ.get('SESSION_CACHE', 'true').lower() in ('yes', 'true')
+RECORD_TIMINGS = os.environ.get('RECORD_TIMINGS', '').lower() in ('yes', 'true')
+# interval, in seconds, at which node processes' CPU, memory, threads and I/O are sampled
+SAMPLE_NODES = os.environ.get('SAMPLE_NODES', '')
+# interval, in seconds, at which the nodes' JMX metrics are recorded
+RECORD_METRICS = os.environ.get('RECORD_METRICS', '')
 
 
 CURRENT_TEST = ""
 
-logging.basicConfig(filename=os.path.join(LOG_SAVED_DIR,"dtest.log"),
-                    filemode='w',
-                    format='%(asctime)s,%(msecs)d %(name)s %(current_test)s %(levelname)s %(message)s',
-                    datefmt='%H:%M:%S',
-                    level=logging.DEBUG)
+class QueueHandler(logging.Handler):
+    """
+    Puts log records on a queue drained by a single writer thread, which
+    formats them with `target`'s formatter and writes them in batches to
+    `target`'s stream. Threads that log never wait on file I/O or on each
+    other. flush() (called by logging.shutdown at exit) waits for the queue
+    to be written.
+    """
+
+    def __init__(self, target, batch_size=256):
+        logging.Handler.__init__(self)
+        self.target = target
+        self.batch_size = batch_size
+        self.queue = Queue.Queue()
+        self.writer = threading.Thread(target=self.__write, name='dtest-log-writer')
+        self.writer.daemon = True
+        self.writer.start()
+
+    def emit(self, record):
+        # only dtest's own records carry the test name
+        if not hasattr(record, 'current_test'):
+            record.current_test = CURRENT_TEST
+        # merge the arguments now, they may have changed by the time the record is written
+        try:
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = self.target.formatter.formatException(record.exc_info)
+                record.exc_info = None
+        except Exception:
+            self.handleError(record)
+            return
+        self.queue.put(record)
+
+    def __write(self):
+        while True:
+            records = [self.queue.get()]
+            while len(records) < self.batch_size:
+                try:
+                    records.append(self.queue.get_nowait())
+                except Queue.Empty:
+                    break
+            try:
+                lines = ''.join(self.target.format(record) + '\n' for record in records)
+                self.target.acquire()
+                try:
+                    self.target.stream.write(lines)
+                    self.target.stream.flush()
+                finally:
+                    self.target.release()
+            except Exception:
+                traceback.print_exc()
+            finally:
+                for _ in records:
+                    self.queue.task_done()
+
+    def flush(self):
+        if self.writer.is_alive():
+            self.queue.join()
+
+    def close(self):
+        self.flush()
+        self.target.close()
+        logging.Handler.close(self)
+
+# Whether dtest owns logging is decided at import, as a runner may add its own
+# handlers later, but the log directory, the log file and the writer thread
+# are only created by configure_logging(), when the first test runs or the
+# first debug message is logged. Collecting tests doesn't touch the disk.
+_own_logging = not logging.root.handlers
+_logging_configured = False
+
+def ensure_log_dir():
+    try:
+        os.mkdir(LOG_SAVED_DIR)
+    except OSError:
+        pass
+
+def configure_logging():
+    global _logging_configured
+    if _logging_configured:
+        return
+    _logging_configured = True
+    ensure_log_dir()
+    if _own_logging:
+        log_file_handler = logging.FileHandler(os.path.join(LOG_SAVED_DIR, slot_suffix("dtest") + ".log"), mode='w')
+        log_file_handler.setFormatter(logging.Formatter('%(asctime)s,%(msecs)d %(name)s %(current_test)s %(levelname)s %(message)s',
+                                                        datefmt='%H:%M:%S'))
+        logging.root.addHandler(QueueHandler(log_file_handler))
+        logging.root.setLevel(logging.DEBUG)
 
 LOG = logging.getLogger('dtest')
 # set python-driver log level to WARN by default for dtest
 logging.getLogger('cassandra').setLevel(logging.WARNING)
 
+if RECORD_TIMINGS:
+    timings.instrument()
+
 # copy the initial environment variables so we can reset them later:
 initial_environment = copy.deepcopy(os.environ)
 def reset_environment_vars():
     os.environ.clear()
     os.environ.update(initial_environment)
 
+_known_version = {}
+
+def cassandra_version():
+    """
+    Returns the version the tests run against as a LooseVersion, resolved
+    once per process from CASSANDRA_VERSION or from the build.xml found in
+    CASSANDRA_DIR, without building a cluster. Returns None if it can't be
+    known up front (e.g. a git: version), in which case ask a cluster.
+    """
+    if 'version' not in _known_version:
+        version = initial_environment.get('CASSANDRA_VERSION')
+        if version:
+            version = version.split(':', 1)[1] if version.startswith('binary:') else version
+            if not re.match(r'^\d+(\.\d+)+', version):
+                version = None
+        else:
+            try:
+                version = get_version_from_build(initial_environment.get('CASSANDRA_DIR', DEFAULT_DIR))
+            except (CCMError, IOError):
+                # not a source or binary install dir
+                version = None
+        _known_version['version'] = LooseVersion(version) if version else None
+    return _known_version['version']
+
+class VersionInfo(object):
+    """
+    The parsed version of a Cassandra install and what it supports. It
+    compares against strings and LooseVersions alike, so
+    version_info(self.cluster) >= '2.1' replaces string comparisons on
+    cluster.version().
+    """
+
+    def __init__(self, version):
+        self.version = LooseVersion(str(version))
+        # the native protocol version dtest connects with by default
+        if self.version >= '2.1':
+            self.protocol_version = 3
+        elif self.version >= '2.0':
+            self.protocol_version = 2
+        else:
+            self.protocol_version = 1
+        self.has_auth_provider = self.version >= '2.0'
+
+    def __cmp__(self, other):
+        if isinstance(other, VersionInfo):
+            other = other.version
+        elif not isinstance(other, LooseVersion):
+            other = LooseVersion(str(other))
+        return cmp(self.version, other)
+
+    def __str__(self):
+        return str(self.version)
+
+    def __repr__(self):
+        return 'VersionInfo(%r)' % str(self.version)
+
+_version_infos = {}
+
+def version_info(cluster_or_node):
+    """
+    Returns the VersionInfo of a ccm cluster or node, computed once per
+    install dir. set_install_dir() to another dir gives a new entry, and so
+    does rebuilding in place (upgrade tests' LOCAL_MODE), because the key
+    includes the modification time of the install dir's build.xml.
+    """
+    install_dir = cluster_or_node.get_install_dir()
+    build_file = os.path.join(install_dir, 'build.xml')
+    key = (install_dir, os.path.getmtime(build_file) if os.path.exists(build_file) else None)
+    if key not in _version_infos:
+        _version_infos[key] = VersionInfo(cluster_or_node.version())
+    return _version_infos[key]
+
 def debug(msg):
-    LOG.debug(msg, extra={"current_test":CURRENT_TEST})
+    if not _logging_configured:
+        configure_logging()
+    if LOG.isEnabledFor(logging.DEBUG):
+        LOG.debug(msg, extra={"current_test":CURRENT_TEST})
     if PRINT_DEBUG:
         print msg
 
 def retry_till_success(fun, *args, **kwargs):
     timeout = kwargs.pop('timeout', 60)
     bypassed_exception = kwargs.pop('bypassed_exception', Exception)
+    # if True, the pause doubles after every failed attempt (up to 2s), with jitter
+    backoff = kwargs.pop('backoff', False)
 
     deadline = time.time() + timeout
+    pause = 0.25
     while True:
         try:
             return fun(*args, **kwargs)
@@ -79,7 +313,32 @@ def retry_till_success(fun, *args, **kwargs):
                 raise
             else:
                 # brief pause before next attempt
-                time.sleep(0.25)
+                if backoff:
+                    time.sleep(min(pause * random.uniform(0.5, 1.0), max(deadline - time.time(), 0)))
+                    pause = min(pause * 2, 2.0)
+                else:
+                    time.sleep(pause)
+
+def wait_for_port(host, port, timeout=60):
+    """
+    Blocks until host:port accepts TCP connections. Each probe is a bare
+    connect, retried with exponential backoff and jitter; the last socket.error
+    is raised if nothing is listening by the end of the timeout.
+    """
+    def probe():
+        sock = socket.create_connection((host, port), timeout=min(timeout, 2))
+        sock.close()
+
+    retry_till_success(probe, timeout=timeout, bypassed_exception=socket.error, backoff=True)
+
+_compiled_alternations = {}
+
+def compile_alternation(patterns):
+    """Compiles a list of regexes into a single one matching any of them, caching the result."""
+    key = tuple(patterns)
+    if key not in _compiled_alternations:
+        _compiled_alternations[key] = re.compile('|'.join('(?:%s)' % p for p in patterns))
+    return _compiled_alternations[key]
 
 def is_win():
     return True if sys.platform == "cygwin" or sys.platform == "win32" else False
@@ -115,12 +374,556 @@ class Runner(threading.Thread):
             raise self.__error
 
 
+class LatencyHistogram(object):
+    """
+    Latency histogram with log-spaced buckets, each 5% wider than the one
+    before. Recording is O(1) and percentiles are accurate to about 5%.
+    Safe to record into from several threads.
+    """
+
+    growth = 1.05
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        bucket = int(math.log(max(seconds * 1e6, 1.0), self.growth))
+        with self.__lock:
+            self.__counts[bucket] = self.__counts.get(bucket, 0) + 1
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def percentile(self, p):
+        """Returns the latency, in seconds, under which p percent of the recorded operations completed."""
+        with self.__lock:
+            rank = p / 100.0 * self.count
+            seen = 0
+            for bucket in sorted(self.__counts):
+                seen += self.__counts[bucket]
+                if seen >= rank:
+                    return min(self.growth ** (bucket + 1) / 1e6, self.max)
+        return 0.0
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class WorkloadRunner(object):
+    """
+    Runs an operation over and over in the background, at a target rate
+    and/or concurrency, recording every operation's latency and counting
+    errors by type.
+
+    `operation` is either a callable, which is called with the operation's
+    index from `threads` worker threads, or a statement (typically prepared),
+    which is executed asynchronously on `session` with `parameters(i)` as its
+    values, with at most `concurrency` requests in flight. `rate`, if given,
+    caps the number of operations started per second.
+
+    Errors are counted and the workload goes on, unless `stop_on_error` is
+    set: then the first error ends it and is raised by check() and stop(),
+    like Runner does. Use Tester.workload() so that tearDown stops it.
+    """
+
+    def __init__(self, operation, session=None, parameters=None, threads=1, concurrency=8, rate=None, stop_on_error=False):
+        self.operation = operation
+        self.session = session
+        self.parameters = parameters
+        self.threads = threads
+        self.concurrency = concurrency
+        self.rate = rate
+        self.stop_on_error = stop_on_error
+        self.latencies = LatencyHistogram()
+        self.errors = {}
+        self.__lock = threading.Lock()
+        self.__issued = 0
+        self.__error = None
+        self.__stopped = threading.Event()
+        self.__workers = []
+        self.__in_flight = threading.Semaphore(concurrency)
+        self.__start = None
+        self.__end = None
+
+    def start(self):
+        self.__start = time.time()
+        if callable(self.operation):
+            target, count = self.__run_calls, self.threads
+        else:
+            assert self.session is not None, "a session is needed to execute statements"
+            target, count = self.__run_statements, 1
+        for _ in xrange(count):
+            worker = threading.Thread(target=target)
+            worker.daemon = True
+            worker.start()
+            self.__workers.append(worker)
+        return self
+
+    def __next(self):
+        """Returns the index of the next operation once it may start, or None when stopped."""
+        with self.__lock:
+            i = self.__issued
+            self.__issued += 1
+        if self.rate:
+            delay = self.__start + i / float(self.rate) - time.time()
+            if delay > 0:
+                self.__stopped.wait(delay)
+        return None if self.__stopped.is_set() else i
+
+    def __record_error(self, e):
+        with self.__lock:
+            name = type(e).__name__
+            self.errors[name] = self.errors.get(name, 0) + 1
+            if self.stop_on_error and self.__error is None:
+                self.__error = e
+                self.__stopped.set()
+
+    def __run_calls(self):
+        while True:
+            i = self.__next()
+            if i is None:
+                return
+            start = time.time()
+            try:
+                self.operation(i)
+            except Exception as e:
+                self.__record_error(e)
+            else:
+                self.latencies.record(time.time() - start)
+
+    def __run_statements(self):
+        while True:
+            i = self.__next()
+            if i is None:
+                break
+            self.__in_flight.acquire()
+            if self.__stopped.is_set():
+                self.__in_flight.release()
+                break
+            start = time.time()
+            try:
+                future = self.session.execute_async(self.operation, self.parameters(i) if self.parameters else None)
+            except Exception as e:
+                self.__in_flight.release()
+                self.__record_error(e)
+                continue
+            future.add_callbacks(self.__on_success, self.__on_error, callback_args=(start,), errback_args=(start,))
+        # wait for the requests still in flight
+        for _ in xrange(self.concurrency):
+            self.__in_flight.acquire()
+
+    def __on_success(self, result, start):
+        self.latencies.record(time.time() - start)
+        self.__in_flight.release()
+
+    def __on_error(self, e, start):
+        self.__record_error(e)
+        self.__in_flight.release()
+
+    def snapshot(self):
+        """Returns the successful operations and errors so far, throughput (ops/s) and latency percentiles (s)."""
+        elapsed = (self.__end or time.time()) - self.__start
+        ops = self.latencies.count
+        return {'ops': ops,
+                'errors': dict(self.errors),
+                'elapsed': elapsed,
+                'throughput': ops / elapsed if elapsed > 0 else 0.0,
+                'mean': self.latencies.mean(),
+                'p50': self.latencies.percentile(50),
+                'p95': self.latencies.percentile(95),
+                'p99': self.latencies.percentile(99),
+                'max': self.latencies.max}
+
+    def check(self):
+        if self.__error is not None:
+            raise self.__error
+
+    def stop(self):
+        """Stops the workload, waits for pending operations and returns its final snapshot."""
+        self.__stopped.set()
+        for worker in self.__workers:
+            worker.join()
+        if self.__end is None:
+            self.__end = time.time()
+        debug("workload stopped: %s" % self.snapshot())
+        self.check()
+        return self.snapshot()
+
+
+class LogArchiver(threading.Thread):
+    """
+    Saves node logs without holding up tearDown.
+
+    A log is hardlinked into the archive when it sits on the same filesystem
+    and its node won't write to it anymore. Otherwise its current content is
+    gzipped by this background thread. Sources are opened before archive()
+    returns, so removing the cluster directory right after is safe.
+    """
+
+    def __init__(self):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.__queue = Queue.Queue()
+
+    def archive(self, src, dest, link=True):
+        """Archives src as dest + '.log', or as dest + '.log.gz' if it has to be copied."""
+        if link:
+            try:
+                os.link(src, dest + '.log')
+                return
+            except (OSError, AttributeError):
+                # cross-device, or no os.link on this platform
+                pass
+        source = open(src, 'rb')
+        # a running node keeps appending, only archive what is there now
+        length = os.fstat(source.fileno()).st_size
+        if not self.is_alive():
+            self.start()
+        self.__queue.put((source, length, dest + '.log.gz'))
+
+    def run(self):
+        while True:
+            source, length, dest = self.__queue.get()
+            try:
+                with source:
+                    out = gzip.open(dest, 'wb')
+                    try:
+                        while length > 0:
+                            chunk = source.read(min(length, 1024 * 1024))
+                            if not chunk:
+                                break
+                            out.write(chunk)
+                            length -= len(chunk)
+                    finally:
+                        out.close()
+            except Exception as e:
+                print "Error archiving log to", dest + ":", str(e)
+            finally:
+                self.__queue.task_done()
+
+    def flush(self):
+        """Blocks until every queued log has been written."""
+        self.__queue.join()
+
+log_archiver = LogArchiver()
+atexit.register(log_archiver.flush)
+
+
+class SessionCache(object):
+    """
+    Hands back an already connected driver session when a test asks again
+    for a connection with the same parameters, instead of building a new
+    driver Cluster and control connection every time. Only the patient_*
+    connections without credentials use it: a test asking for a plain
+    cql_connection, or for one as a given user, may be testing connecting
+    itself (authentication, a revoked login), and always gets a new session.
+
+    An entry is dropped, and its driver Cluster shut down, when the session
+    was shut down or when its node was stopped or restarted since it was
+    connected. A hit hands back the very session object given out before,
+    which is never modified: if the test changed its keyspace or one of its
+    defaults (row factory, timeout, consistency, fetch size) since, it is a
+    miss and a new session is connected, leaving the changed one as it is.
+    """
+
+    session_defaults = ('row_factory', 'default_timeout', 'default_consistency_level', 'default_fetch_size')
+
+    def __init__(self):
+        self.__entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, node):
+        entry = self.__entries.get(key)
+        if entry is not None:
+            session, pid, defaults = entry
+            if session.is_shutdown or session.cluster.is_shutdown or node.pid != pid or not node.is_running():
+                del self.__entries[key]
+                session.cluster.shutdown()
+            elif session.keyspace == key[1] and self.__defaults(session) == defaults:
+                self.hits += 1
+                return session
+        self.misses += 1
+        return None
+
+    def __defaults(self, session):
+        return dict((attr, getattr(session, attr)) for attr in self.session_defaults if hasattr(session, attr))
+
+    def put(self, key, node, session):
+        self.__entries[key] = (session, node.pid, self.__defaults(session))
+
+    def clear(self):
+        self.__entries.clear()
+
+session_cache_totals = {'hits': 0, 'misses': 0}
+
+def report_session_cache_totals():
+    # don't configure logging, and truncate the last run's log, if no test ran
+    if session_cache_totals['hits'] + session_cache_totals['misses']:
+        debug("session cache: %(hits)d hits, %(misses)d misses over the run" % session_cache_totals)
+
+atexit.register(report_session_cache_totals)
+
+
+class SlottedCluster(Cluster):
+    """
+    A ccm Cluster whose nodes are placed in this process' loopback range and
+    port block (see WORKER_SLOT), so it can run next to other workers' clusters.
+    """
+
+    def populate(self, nodes, *args, **kwargs):
+        kwargs.setdefault('ipprefix', IP_PREFIX)
+        return Cluster.populate(self, nodes, *args, **kwargs)
+
+    def create_node(self, name, auto_bootstrap, thrift_interface, storage_interface, jmx_port, remote_debug_port, initial_token, *args, **kwargs):
+        return Cluster.create_node(self, name, auto_bootstrap, thrift_interface, storage_interface,
+                                   slot_port(jmx_port), slot_port(remote_debug_port), initial_token, *args, **kwargs)
+
+
+def kill_cluster(cluster, timeout=10):
+    """
+    SIGKILLs every running node of cluster at once, then waits for all of the
+    processes to be gone, so that their ports can be bound again.
+    """
+    if is_win():
+        cluster.stop(gently=False)
+        return
+
+    killed = []
+    for node in cluster.nodelist():
+        if node.is_running():
+            try:
+                os.kill(node.pid, signal.SIGKILL)
+                killed.append(node.pid)
+            except OSError as e:
+                if e.errno != errno.ESRCH:
+                    raise
+
+    deadline = time.time() + timeout
+    while killed and time.time() < deadline:
+        for pid in list(killed):
+            try:
+                os.kill(pid, 0)
+            except OSError:
+                killed.remove(pid)
+        if killed:
+            time.sleep(0.05)
+    if killed:
+        raise RuntimeError("Node processes %s did not exit after SIGKILL" % killed)
+
+
+class DirectoryReaper(threading.Thread):
+    """
+    Removes test directories in the background so that the next test doesn't
+    wait on rmtree. The queue is bounded: when deletes fall behind, tearDown
+    blocks rather than letting old directories pile up on disk.
+
+    Queued directories are listed in the `record` file until they are gone,
+    so that recover() can remove the ones a killed process left behind.
+    """
+
+    def __init__(self, max_pending=4, record=PENDING_DELETES):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.__queue = Queue.Queue(max_pending)
+        self.__record = record
+        self.__pending = []
+        self.__lock = threading.Lock()
+        self.__recovered = False
+
+    def remove(self, path):
+        """Queues path for removal. The caller must make sure nothing uses it anymore."""
+        if not self.is_alive():
+            self.start()
+        with self.__lock:
+            self.__pending.append(path)
+            self.__save()
+        self.__queue.put(path)
+
+    def recover(self):
+        """Queues the directories left in the record by a process that died before removing them."""
+        if self.__recovered:
+            return
+        self.__recovered = True
+        if not os.path.exists(self.__record):
+            return
+        with open(self.__record) as f:
+            left = [line.strip('\n') for line in f if line.strip()]
+        with self.__lock:
+            left = [path for path in left if path not in self.__pending]
+            self.__save()
+        for path in left:
+            if os.path.exists(path):
+                debug("removing test directory left by an earlier run: " + path)
+                self.remove(path)
+
+    def __save(self):
+        if self.__pending:
+            with open(self.__record, 'w') as f:
+                f.write(''.join(path + '\n' for path in self.__pending))
+        elif os.path.exists(self.__record):
+            os.remove(self.__record)
+
+    def run(self):
+        while True:
+            path = self.__queue.get()
+            try:
+                shutil.rmtree(path)
+            except Exception as e:
+                print "Error removing test directory", path + ":", str(e)
+            finally:
+                with self.__lock:
+                    self.__pending.remove(path)
+                    self.__save()
+                self.__queue.task_done()
+
+    def flush(self):
+        """Blocks until every queued directory has been removed."""
+        self.__queue.join()
+
+directory_reaper = DirectoryReaper()
+# registered before any user of the reaper, so it runs after them at exit
+atexit.register(directory_reaper.flush)
+
+
+class ClusterPool(object):
+    """
+    Keeps running clusters alive between tests so that a test asking for a
+    topology that is already up can lease it instead of paying for a full
+    populate() and start() cycle.
+
+    Clusters are keyed by node count, partitioner, version/install dir and
+    the yaml options set on the cluster (which include num_tokens and any
+    cluster_options). All nodes bind the same loopback addresses, so only
+    one idle cluster is kept at a time: leasing a different key evicts it.
+    """
+
+    def __init__(self):
+        self.__idle = {}
+
+    def key(self, cluster, nodes):
+        options = sorted((k, repr(v)) for k, v in cluster._config_options.items())
+        return (nodes, cluster.partitioner, str(version_info(cluster)), cluster.get_install_dir(), tuple(options))
+
+    def lease(self, key):
+        """Returns a (cluster, test_path) tuple matching key, or None."""
+        return self.__idle.pop(key, None)
+
+    def release(self, key, cluster, test_path):
+        """
+        Makes a running cluster available to later tests. Returns False, and
+        keeps nothing, if the cluster no longer matches its key: the test
+        added or removed nodes, or changed its configuration, partitioner or
+        install dir after leasing it.
+        """
+        if self.key(cluster, len(cluster.nodelist())) != key:
+            return False
+        self.drain()
+        self.__idle[key] = (cluster, test_path)
+        return True
+
+    def drain(self):
+        """Stops and removes every idle cluster."""
+        while self.__idle:
+            key, (cluster, test_path) = self.__idle.popitem()
+            debug("evicting pooled ccm cluster at: " + test_path)
+            try:
+                jolokia_agents.forget(cluster.nodelist())
+                kill_cluster(cluster)
+                directory_reaper.remove(test_path)
+            except Exception as e:
+                print "Error removing pooled cluster:", str(e)
+
+cluster_pool = ClusterPool()
+atexit.register(cluster_pool.drain)
+
+
+class ClusterTemplates(object):
+    """
+    On-disk cache of freshly bootstrapped clusters.
+
+    A template is the ccm directory of a cluster that was started once and
+    stopped cleanly, minus its logs. Cloning it gives a new cluster that
+    already has its tokens, system keyspaces and saved caches, so starting it
+    skips token allocation, schema setup and most of gossip settling.
+    Templates are keyed like ClusterPool entries plus the worker's address
+    range, and live in CLUSTER_TEMPLATE_DIR until removed by hand.
+    """
+
+    def __init__(self, root, link_data=False):
+        self.root = root
+        self.link_data = link_data
+
+    def path(self, cluster, nodes):
+        key = cluster_pool.key(cluster, nodes) + (IP_PREFIX,)
+        return os.path.join(self.root, hashlib.md5(repr(key)).hexdigest(), cluster.name)
+
+    def save(self, cluster, path):
+        """Stores a stopped cluster as the template at path."""
+        tmp_dir = tempfile.mkdtemp(prefix='template-', dir=self.root if os.path.isdir(self.root) else None)
+        try:
+            copy = os.path.join(tmp_dir, cluster.name)
+            self.__copy_tree(cluster.get_path(), copy, link=False)
+            # the template's own logs would trip tearDown's error scan in every clone
+            for node in cluster.nodelist():
+                logs = os.path.join(copy, node.name, 'logs')
+                for f in os.listdir(logs):
+                    os.remove(os.path.join(logs, f))
+            try:
+                os.makedirs(os.path.dirname(path))
+                os.rename(copy, path)
+            except OSError:
+                # another worker stored the same template first
+                pass
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def clone(self, path, test_path):
+        """Copies the template at path into test_path and returns the loaded cluster."""
+        name = os.path.basename(path)
+        shutil.rmtree(os.path.join(test_path, name), ignore_errors=True)
+        self.__copy_tree(path, os.path.join(test_path, name), link=self.link_data)
+        cluster = ClusterFactory.load(test_path, name)
+        for node in cluster.nodelist():
+            # rewrites the yaml and logging configs, which hold absolute paths
+            node.import_config_files()
+        return cluster
+
+    def __copy_tree(self, src, dst, link):
+        if not link and sys.platform.startswith('linux'):
+            subprocess.check_call(['cp', '-a', '--reflink=auto', src, dst])
+            return
+
+        for root, dirs, files in os.walk(src):
+            relpath = os.path.relpath(root, src)
+            target = os.path.normpath(os.path.join(dst, relpath))
+            os.makedirs(target)
+            # sstables are immutable, so files under <node>/data can be shared
+            share = link and relpath.split(os.sep)[1:2] == ['data']
+            for f in files:
+                if share:
+                    os.link(os.path.join(root, f), os.path.join(target, f))
+                else:
+                    shutil.copy2(os.path.join(root, f), os.path.join(target, f))
+
+cluster_templates = ClusterTemplates(CLUSTER_TEMPLATE_DIR, link_data=CLUSTER_TEMPLATES == 'hardlink')
+
+
 class Tester(TestCase):
 
     def __init__(self, *argv, **kwargs):
         # if False, then scan the log of each node for errors after every test.
         if not hasattr(self, '_preserve_cluster'):
             self._preserve_cluster = False
+        # if True, lease_cluster() may hand out a running cluster left in
+        # cluster_pool by a previous test, possibly from another class
+        if not hasattr(self, '_pool_cluster'):
+            self._pool_cluster = False
+        self._pool_key = None
         self.allow_log_errors = False
         self.cluster_options = kwargs.pop('cluster_options', None)
         super(Tester, self).__init__(*argv, **kwargs)
@@ -136,18 +939,19 @@ class Tester(TestCase):
         debug("cluster ccm directory: "+self.test_path)
         version = os.environ.get('CASSANDRA_VERSION')
         cdir = os.environ.get('CASSANDRA_DIR', DEFAULT_DIR)
+        cluster_class = SlottedCluster if WORKER_SLOT else Cluster
 
         if version:
-            cluster = Cluster(self.test_path, name, cassandra_version=version)
+            cluster = cluster_class(self.test_path, name, cassandra_version=version)
         else:
-            cluster = Cluster(self.test_path, name, cassandra_dir=cdir)
+            cluster = cluster_class(self.test_path, name, cassandra_dir=cdir)
 
         if DISABLE_VNODES:
             cluster.set_configuration_options(values={'num_tokens': None})
         else:
             cluster.set_configuration_options(values={'initial_token': None, 'num_tokens': NUM_TOKENS})
 
-        if cluster.version() >= "2.1":
+        if version_info(cluster) >= "2.1":
             if OFFHEAP_MEMTABLES:
                 cluster.set_configuration_options(values={'memtable_allocation_type': 'offheap_objects'})
 
@@ -158,6 +962,9 @@ class Tester(TestCase):
             # driver logging is very verbose when nodes start going down -- bump up the level
             logging.getLogger('cassandra').setLevel(logging.CRITICAL)
 
+        # the nodes' JMX agents go away with them
+        jolokia_agents.forget(self.cluster.nodelist())
+
         if KEEP_TEST_DIR:
             self.cluster.stop(gently=RECORD_COVERAGE)
         else:
@@ -166,11 +973,12 @@ class Tester(TestCase):
             # otherwise we can just kill the process
             if RECORD_COVERAGE:
                 self.cluster.stop(gently=True)
+            else:
+                kill_cluster(self.cluster)
 
-            # Cleanup everything:
+            # Cleanup everything, in the background:
             debug("removing ccm cluster " + self.cluster.name + " at: " + self.test_path)
-            self.cluster.remove()
-            os.rmdir(self.test_path)
+            directory_reaper.remove(self.test_path)
         if os.path.exists(LAST_TEST_DIR):
             os.remove(LAST_TEST_DIR)
 
@@ -186,9 +994,13 @@ class Tester(TestCase):
     def setUp(self):
         global CURRENT_TEST
         CURRENT_TEST = self.id() + self._testMethodName
+        configure_logging()
+        self.timer = timings.TestTimer(self.id())
+        self.timer.switch('setUp')
         # cleaning up if a previous execution didn't trigger tearDown (which
         # can happen if it is interrupted by KeyboardInterrupt)
         # TODO: move that part to a generic fixture
+        directory_reaper.recover()
         if os.path.exists(LAST_TEST_DIR):
             with open(LAST_TEST_DIR) as f:
                 self.test_path = f.readline().strip('\n')
@@ -202,6 +1014,11 @@ class Tester(TestCase):
                 # after a restart, /tmp will be emptied so we'll get an IOError when loading the old cluster here
                 pass
 
+        # pooled clusters hold on to the loopback addresses, so they have to
+        # go before a test that builds its own cluster
+        if not self._pool_cluster:
+            cluster_pool.drain()
+
         self.cluster = self._get_cluster()
         if RECORD_COVERAGE:
             self.__setup_jacoco()
@@ -220,18 +1037,135 @@ class Tester(TestCase):
                 'request_timeout_in_ms' : timeout
             })
 
-        with open(LAST_TEST_DIR, 'w') as f:
-            f.write(self.test_path + '\n')
-            f.write(self.cluster.name)
+        self._write_last_test_dir()
         if DEBUG:
             self.cluster.set_log_level("DEBUG")
         if TRACE:
             self.cluster.set_log_level("TRACE")
         self.connections = []
+        self.session_cache = SessionCache()
         self.runners = []
+        self._mark_logs()
+        # freshCluster runs setUp a second time: don't leave the first
+        # sampler polling every later cluster
+        if getattr(self, 'sampler', None) is not None:
+            self.sampler.stop()
+        self.sampler = None
+        if SAMPLE_NODES:
+            # reads self.cluster on every sample, which follows clusters
+            # leased from the pool and nodes added with tools.new_node
+            self.sampler = ResourceSampler(lambda: self.cluster.nodelist(), interval=float(SAMPLE_NODES))
+            self.sampler.start()
+        for recorder in getattr(self, 'metric_recorders', []):
+            recorder.stop()
+        self.metric_recorders = []
+        if RECORD_METRICS:
+            self.record_metrics(interval=float(RECORD_METRICS))
+        self.timer.switch('test')
+
+    def record_metrics(self, metrics=None, interval=1.0):
+        """
+        Starts recording metrics (by default metrics_recorder.DEFAULT_METRICS)
+        on the nodes of this test's cluster, until tearDown. Returns the
+        MetricsRecorder, to wait on or read the series from.
+        """
+        recorder = MetricsRecorder(lambda: self.cluster.nodelist(), metrics=metrics, interval=interval)
+        recorder.start()
+        self.metric_recorders.append(recorder)
+        return recorder
+
+    def _write_last_test_dir(self):
+        with open(LAST_TEST_DIR, 'w') as f:
+            f.write(self.test_path + '\n')
+            f.write(self.cluster.name)
 
-    def copy_logs(self, directory=None, name=None):
-        """Copy the current cluster's log files somewhere, by default to LOG_SAVED_DIR with a name of 'last'"""
+    def lease_cluster(self, nodes):
+        """
+        Populates and starts the test cluster with `nodes` nodes and returns it.
+
+        When CLUSTER_POOL is set and the test class allows it (see
+        canPoolCluster), a running cluster with the same topology and
+        configuration left over by a previous test is used instead. Its
+        non-system keyspaces are dropped when it is handed back in tearDown.
+        """
+        if self.cluster.nodelist():
+            return self.cluster
+
+        if not self._pool_cluster:
+            self._populate_and_start(nodes)
+            return self.cluster
+
+        self._pool_key = cluster_pool.key(self.cluster, nodes)
+        leased = cluster_pool.lease(self._pool_key)
+        if leased is None:
+            cluster_pool.drain()
+            self._populate_and_start(nodes)
+        else:
+            # the cluster built by setUp was never started, just drop its directory
+            self.cluster.remove()
+            os.rmdir(self.test_path)
+            self.cluster, self.test_path = leased
+            debug("leased pooled ccm cluster at: " + self.test_path)
+            self._write_last_test_dir()
+            self._mark_logs()
+        return self.cluster
+
+    def _populate_and_start(self, nodes):
+        """
+        Brings up a new cluster of `nodes` nodes. With CLUSTER_TEMPLATES set,
+        it is cloned from a template, which is built the first time a given
+        topology and configuration is asked for.
+        """
+        start = time.time()
+        if not CLUSTER_TEMPLATES or RECORD_COVERAGE:
+            self.cluster.populate(nodes).start()
+            debug("populated and started cluster in %.2fs" % (time.time() - start))
+            return
+
+        template = cluster_templates.path(self.cluster, nodes)
+        if os.path.isdir(template):
+            self.cluster = cluster_templates.clone(template, self.test_path)
+            if DEBUG:
+                self.cluster.set_log_level("DEBUG")
+            if TRACE:
+                self.cluster.set_log_level("TRACE")
+        else:
+            debug("building cluster template at " + template)
+            self.cluster.populate(nodes).start(wait_for_binary_proto=True)
+            self.cluster.stop(gently=True)
+            cluster_templates.save(self.cluster, template)
+        self.cluster.start()
+        debug("started cluster from template in %.2fs" % (time.time() - start))
+
+    def _release_cluster(self):
+        """Drops the test's keyspaces and hands the running cluster back to cluster_pool."""
+        nodes = self.cluster.nodelist()
+        if not all(node.is_running() for node in nodes):
+            return False
+
+        session = self.patient_cql_connection(nodes[0])
+        try:
+            for ks in session.cluster.metadata.keyspaces.keys():
+                if not ks.startswith('system'):
+                    session.execute('DROP KEYSPACE "%s"' % ks)
+        finally:
+            session.cluster.shutdown()
+
+        if not cluster_pool.release(self._pool_key, self.cluster, self.test_path):
+            return False
+        debug("returned ccm cluster at " + self.test_path + " to the pool")
+        if os.path.exists(LAST_TEST_DIR):
+            os.remove(LAST_TEST_DIR)
+        return True
+
+    def copy_logs(self, directory=None, name=None, link=False):
+        """
+        Copy the current cluster's log files somewhere, by default to LOG_SAVED_DIR with a name of 'last'.
+
+        The copies are made in the background by log_archiver, gzipped, unless
+        `link` is set and the logs can be hardlinked, which is only safe if
+        the nodes are about to be stopped. Call log_archiver.flush() to wait for them.
+        """
         if directory is None:
             directory = LOG_SAVED_DIR
         if name is None:
@@ -246,7 +1180,7 @@ class Tester(TestCase):
             logdir = os.path.join(directory, basedir)
             os.mkdir(logdir)
             for n, log in logs:
-                shutil.copyfile(log, os.path.join(logdir, n + ".log"))
+                log_archiver.archive(log, os.path.join(logdir, n), link=link)
             if os.path.exists(name):
                 os.unlink(name)
             if not is_win():
@@ -262,30 +1196,37 @@ class Tester(TestCase):
                                  password=None, compression=True, protocol_version=None):
 
         node_ip = self.get_ip_from_node(node)
-        wlrr = WhiteListRoundRobinPolicy([node_ip])
 
         return self._create_session(node, keyspace, user, password, compression,
-                                    protocol_version, wlrr)
+                                    protocol_version, whitelist=(node_ip,))
 
-    def _create_session(self, node, keyspace, user, password, compression, protocol_version, load_balancing_policy=None):
+    def _create_session(self, node, keyspace, user, password, compression, protocol_version, whitelist=None, cached=False):
         node_ip = self.get_ip_from_node(node)
 
         if protocol_version is None:
-            if self.cluster.version() >= '2.1':
-                protocol_version = 3
-            elif self.cluster.version() >= '2.0':
-                protocol_version = 2
-            else:
-                protocol_version = 1
+            protocol_version = version_info(self.cluster).protocol_version
+
+        cached = cached and SESSION_CACHE
+        key = (node_ip, keyspace, user, password, protocol_version, compression, whitelist)
+        if cached:
+            session = self.session_cache.get(key, node)
+            if session is not None:
+                return session
 
         if user is not None:
             auth_provider = self.get_auth_provider(user=user, password=password)
         else:
             auth_provider = None
 
+        load_balancing_policy = WhiteListRoundRobinPolicy(list(whitelist)) if whitelist else None
         cluster = PyCluster([node_ip], auth_provider=auth_provider, compression=compression,
                             protocol_version=protocol_version, load_balancing_policy=load_balancing_policy)
-        session = cluster.connect()
+        try:
+            session = cluster.connect()
+        except Exception:
+            # don't leak the driver's threads and pools when the node isn't ready yet
+            cluster.shutdown()
+            raise
 
         # temporarily increase client-side timeout to 1m to determine
         # if the cluster is simply responding slowly to requests
@@ -295,6 +1236,8 @@ class Tester(TestCase):
             session.set_keyspace(keyspace)
 
         self.connections.append(session)
+        if cached:
+            self.session_cache.put(key, node, session)
         return session
 
     def patient_cql_connection(self, node, keyspace=None, version=None,
@@ -302,23 +1245,28 @@ class Tester(TestCase):
         protocol_version=None):
         """
         Returns a connection after it stops throwing NoHostAvailables due to not being ready.
+        The node's native port is polled first, so no driver cluster is built
+        until something is listening.
 
         If the timeout is exceeded, the exception is raised.
         """
         if is_win():
             timeout = timeout * 5
 
+        deadline = time.time() + timeout
+        self.wait_for_native_transport(node, timeout=timeout)
         return retry_till_success(
-            self.cql_connection,
+            self._create_session,
             node,
             keyspace=keyspace,
-            version=version,
             user=user,
             password=password,
-            timeout=timeout,
+            timeout=max(deadline - time.time(), 0),
             compression=compression,
             protocol_version=protocol_version,
-            bypassed_exception=NoHostAvailable
+            cached=user is None and password is None,
+            bypassed_exception=NoHostAvailable,
+            backoff=True
         )
 
     def patient_exclusive_cql_connection(self, node, keyspace=None, version=None,
@@ -326,25 +1274,47 @@ class Tester(TestCase):
         protocol_version=None):
         """
         Returns a connection after it stops throwing NoHostAvailables due to not being ready.
+        The node's native port is polled first, so no driver cluster is built
+        until something is listening.
 
         If the timeout is exceeded, the exception is raised.
         """
         if is_win():
             timeout = timeout * 5
 
+        deadline = time.time() + timeout
+        self.wait_for_native_transport(node, timeout=timeout)
         return retry_till_success(
-            self.exclusive_cql_connection,
+            self._create_session,
             node,
             keyspace=keyspace,
-            version=version,
             user=user,
             password=password,
-            timeout=timeout,
+            timeout=max(deadline - time.time(), 0),
             compression=compression,
             protocol_version=protocol_version,
-            bypassed_exception=NoHostAvailable
+            whitelist=(self.get_ip_from_node(node),),
+            cached=user is None and password is None,
+            bypassed_exception=NoHostAvailable,
+            backoff=True
         )
 
+    def wait_for_native_transport(self, node, timeout=60):
+        """
+        Waits until node's native protocol port accepts connections, which is
+        much cheaper to poll than building driver sessions until one works.
+
+        Returns False if the port never opened within timeout. Nodes without
+        a binary interface return True immediately.
+        """
+        binary_interface = node.network_interfaces.get('binary')
+        if binary_interface:
+            try:
+                wait_for_port(binary_interface[0], binary_interface[1], timeout=timeout)
+            except socket.error:
+                return False
+        return True
+
     def create_ks(self, session, name, rf):
         query = 'CREATE KEYSPACE %s WITH replication={%s}'
         if isinstance(rf, types.IntType):
@@ -379,7 +1349,7 @@ class Tester(TestCase):
             query = '%s AND read_repair_chance=%f' % (query, read_repair)
         if gc_grace is not None:
             query = '%s AND gc_grace_seconds=%d' % (query, gc_grace)
-        if self.cluster.version() >= "2.0":
+        if version_info(self.cluster) >= "2.0":
             if speculative_retry is not None:
                 query = '%s AND speculative_retry=\'%s\'' % (query, speculative_retry)
 
@@ -400,18 +1370,40 @@ class Tester(TestCase):
                     if KEEP_TEST_DIR:
                         cluster.stop(gently=RECORD_COVERAGE)
                     else:
-                        cluster.remove()
-                        os.rmdir(test_path)
+                        if RECORD_COVERAGE:
+                            cluster.stop(gently=True)
+                        else:
+                            kill_cluster(cluster)
+                        directory_reaper.remove(test_path)
                     os.remove(LAST_TEST_DIR)
                 except IOError:
                     # after a restart, /tmp will be emptied so we'll get an IOError when loading the old cluster here
                     pass
 
     def tearDown(self):
+        self.timer.switch('tearDown')
         reset_environment_vars()
 
+        if self.sampler is not None:
+            self.sampler.stop()
+            self.resource_samples = self.sampler.summary()
+            debug("node resources: %s" % self.resource_samples)
+            self.timer.attach('resources', self.resource_samples)
+
+        for recorder in self.metric_recorders:
+            recorder.stop()
+        if RECORD_METRICS:
+            self.metric_samples = self.metric_recorders[0].summary()
+            debug("node metrics: %s" % self.metric_samples)
+            self.timer.attach('metrics', self.metric_samples)
+
         for con in self.connections:
             con.cluster.shutdown()
+        self.session_cache.clear()
+        if SESSION_CACHE:
+            debug("session cache: %d hits, %d misses" % (self.session_cache.hits, self.session_cache.misses))
+            session_cache_totals['hits'] += self.session_cache.hits
+            session_cache_totals['misses'] += self.session_cache.misses
 
         for runner in self.runners:
             try:
@@ -420,25 +1412,42 @@ class Tester(TestCase):
                 pass
 
         failed = sys.exc_info() != (None, None, None)
+        self.timer.switch('log_scan')
         try:
             for node in self.cluster.nodelist():
                 if self.allow_log_errors == False:
-                    errors = list(self.__filter_errors([ msg for msg, i in node.grep_log("ERROR")]))
+                    errors = list(self.__filter_errors(self.__scan_log_errors(node)))
                     if len(errors) is not 0:
                         failed = True
                         raise AssertionError('Unexpected error in %s node log: %s' % (node.name, errors))
         finally:
+            self.timer.switch('copy_logs')
             try:
                 if failed or KEEP_LOGS:
                     # means the test failed. Save the logs for inspection.
-                    self.copy_logs()
+                    # Unless the cluster outlives the test, its nodes are
+                    # about to stop writing and the logs can be hardlinked.
+                    stays_up = not failed and (self._preserve_cluster or self._pool_key is not None)
+                    self.copy_logs(link=not stays_up)
             except Exception as e:
                     print "Error saving log:", str(e)
             finally:
-                if not self._preserve_cluster:
-                    self._cleanup_cluster()
-                elif self._preserve_cluster and failed:
-                    self._cleanup_cluster()
+                self.timer.switch('cleanup')
+                try:
+                    if self._pool_key is not None and not failed:
+                        try:
+                            released = self._release_cluster()
+                        except Exception as e:
+                            debug("Could not return cluster to the pool: " + str(e))
+                            released = False
+                        if not released:
+                            self._cleanup_cluster()
+                    elif not self._preserve_cluster:
+                        self._cleanup_cluster()
+                    elif self._preserve_cluster and failed:
+                        self._cleanup_cluster()
+                finally:
+                    self.timer.finish(TIMINGS_FILE if RECORD_TIMINGS else None)
 
     def go(self, func):
         runner = Runner(func)
@@ -446,6 +1455,15 @@ class Tester(TestCase):
         runner.start()
         return runner
 
+    def workload(self, operation, **kwargs):
+        """
+        Starts a WorkloadRunner for operation (see its docstring for the
+        options) that tearDown will stop, and returns it.
+        """
+        runner = WorkloadRunner(operation, **kwargs)
+        self.runners.append(runner)
+        return runner.start()
+
     def skip(self, msg):
         if not NO_SKIP:
             raise SkipTest(msg)
@@ -478,13 +1496,32 @@ class Tester(TestCase):
         """Filter errors, removing those that match self.ignore_log_patterns"""
         if not hasattr(self, 'ignore_log_patterns'):
             self.ignore_log_patterns = []
+        if not self.ignore_log_patterns:
+            for e in errors:
+                yield e
+            return
+        ignored = compile_alternation(self.ignore_log_patterns)
         for e in errors:
-            for pattern in self.ignore_log_patterns:
-                if re.search(pattern, e):
-                    break
-            else:
+            if not ignored.search(e):
                 yield e
 
+    def _mark_logs(self):
+        """Remembers how far each node's log goes, so tearDown only scans what this test appended."""
+        self._log_marks = dict((node.name, node.mark_log()) for node in self.cluster.nodelist())
+
+    def __scan_log_errors(self, node):
+        """Returns the ERROR lines node has logged since _mark_logs()."""
+        logfile = node.logfilename()
+        if not os.path.exists(logfile):
+            return []
+        mark = self._log_marks.get(node.name, 0)
+        if os.path.getsize(logfile) < mark:
+            # the log was rotated or truncated, so all of it is new
+            mark = 0
+        with open(logfile) as f:
+            f.seek(mark)
+            return [line for line in f if 'ERROR' in line]
+
     def get_ip_from_node(self, node):
         if node.network_interfaces['binary']:
             node_ip = node.network_interfaces['binary'][0]
@@ -493,7 +1530,7 @@ class Tester(TestCase):
         return node_ip
 
     def get_auth_provider(self, user, password):
-        if self.cluster.version() >= '2.0':
+        if version_info(self.cluster).has_auth_provider:
             return PlainTextAuthProvider(username=user, password=password)
         else:
             return self.make_auth(user, password)
@@ -518,12 +1555,24 @@ def canReuseCluster(Tester):
     Tester.__init__ = __init__ # set the class' __init__ to the new one
     return Tester
 
+def canPoolCluster(Tester):
+    orig_init = Tester.__init__
+    # make copy of original __init__, so we can call it without recursion
+
+    def __init__(self, *args, **kwargs):
+        self._pool_cluster = CLUSTER_POOL
+        orig_init(self, *args, **kwargs) # call the original __init__
+
+    Tester.__init__ = __init__ # set the class' __init__ to the new one
+    return Tester
+
 
 class freshCluster():
 
     def __call__(self, f):
         def wrapped(obj):
             obj._preserve_cluster = False
+            obj._pool_cluster = False
             obj.setUp()
             f(obj)
         wrapped.__name__ = f.__name__
@@ -553,7 +1602,7 @@ class MultiError(Exception):
         return output
 
 
-def run_scenarios(scenarios, handler, deferred_exceptions=tuple()):
+def run_scenarios(scenarios, handler, deferred_exceptions=tuple(), workers=1, namespace=None):
     """
     Runs multiple scenarios from within a single test method.
 
@@ -565,25 +1614,61 @@ def run_scenarios(scenarios, handler, deferred_exceptions=tuple()):
 
     Exceptions which occur will be bundled up and raised as a single MultiError exception, either when: a) all scenarios have run,
     or b) on the first exception encountered which is not whitelisted in deferred_exceptions.
-    """
-    errors = []
-    tracebacks = []
-
-    for i, scenario in enumerate(scenarios, 1):
-        debug("running scenario {}/{}: {}".format(i, len(scenarios), scenario))
 
+    With workers > 1, up to that many scenarios run at the same time on a pool of threads, so they must not depend on each other.
+    After a non-deferrable exception no new scenario is started, but those already running are allowed to finish. If namespace
+    is given, handler(item, '<namespace>_<n>') is called instead, n being the scenario's position, so that each scenario can
+    work in a keyspace or table of its own. Exceptions are reported in scenario order, followed by a log of how long each scenario took.
+    """
+    total = len(scenarios)
+    failures = {}
+    durations = {}
+    aborted = threading.Event()
+
+    def run(i, scenario):
+        debug("running scenario {}/{}: {}".format(i, total, scenario))
+        start = time.time()
         try:
-            handler(scenario)
+            if namespace is None:
+                handler(scenario)
+            else:
+                handler(scenario, '{}_{}'.format(namespace, i))
         except deferred_exceptions as e:
-            tracebacks.append(traceback.format_exc(sys.exc_info()))
-            errors.append(type(e)('encountered {} {} running scenario:\n  {}\n'.format(e.__class__.__name__, e.message, scenario)))
-            debug("scenario {}/{} encountered a deferrable exception, continuing".format(i, len(scenarios)))
+            failures[i] = (type(e)('encountered {} {} running scenario:\n  {}\n'.format(e.__class__.__name__, e.message, scenario)),
+                           traceback.format_exc(sys.exc_info()))
+            debug("scenario {}/{} encountered a deferrable exception, continuing".format(i, total))
         except Exception as e:
             # catch-all for any exceptions not intended to be deferred
-            tracebacks.append(traceback.format_exc(sys.exc_info()))
-            errors.append(type(e)('encountered {} {} running scenario:\n  {}\n'.format(e.__class__.__name__, e.message, scenario)))
-            debug("scenario {}/{} encountered a non-deferrable exception, aborting".format(i, len(scenarios)))
-            raise MultiError(errors, tracebacks)
+            failures[i] = (type(e)('encountered {} {} running scenario:\n  {}\n'.format(e.__class__.__name__, e.message, scenario)),
+                           traceback.format_exc(sys.exc_info()))
+            debug("scenario {}/{} encountered a non-deferrable exception, aborting".format(i, total))
+            aborted.set()
+        finally:
+            durations[i] = time.time() - start
 
-    if errors:
-        raise MultiError(errors, tracebacks)
+    pending = Queue.Queue()
+    for item in enumerate(scenarios, 1):
+        pending.put(item)
+
+    def work():
+        while not aborted.is_set():
+            try:
+                i, scenario = pending.get_nowait()
+            except Queue.Empty:
+                return
+            run(i, scenario)
+
+    if workers > 1:
+        threads = [threading.Thread(target=work) for _ in xrange(min(workers, total))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    else:
+        work()
+
+    debug("scenario timings: " + ", ".join("{}: {:.2f}s".format(i, durations[i]) for i in sorted(durations)))
+
+    if failures:
+        order = sorted(failures)
+        raise MultiError([failures[i][0] for i in order], [failures[i][1] for i in order])
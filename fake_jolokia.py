@@ -0,0 +1,308 @@
+"""
+A stand-in for the Jolokia agent, to exercise jmxutils without Cassandra or
+Java.
+
+FakeJolokiaServer answers Jolokia's HTTP protocol (read, write, exec and
+search requests, alone or in bulk, over keep-alive connections) from an
+in-memory MBeanRegistry. cassandra_registry() fills one with mbeans named
+like a node's, and FakeNode is enough of a ccm node for JolokiaAgent:
+
+    with FakeJolokiaServer(cassandra_registry()) as server:
+        jmx = JolokiaAgent(FakeNode(), port=server.port)
+        jmx.read_attribute(make_mbean('db', 'IndexSummaries'), 'AverageIndexInterval')
+
+jmxutils_test.py tests JolokiaAgent against it, and jmx_benchmark.py measures
+its request throughput and latency.
+"""
+import BaseHTTPServer
+import SocketServer
+import fnmatch
+import json
+import socket
+import sys
+import threading
+import time
+
+from jmxutils import make_mbean
+
+
+def parse_name(name):
+    """Splits an mbean name or pattern into its domain and dict of key properties."""
+    domain, _, properties = name.partition(':')
+    props = {}
+    for prop in properties.split(','):
+        if prop:
+            key, _, value = prop.partition('=')
+            props[key] = value
+    return domain, props
+
+
+def name_matches(pattern, name):
+    """
+    Matches an mbean name against a JMX pattern: wildcards in the domain and
+    in property values, and a trailing ',*' (or a lone '*') allowing other
+    properties.
+    """
+    pattern_domain, pattern_props = parse_name(pattern)
+    domain, props = parse_name(name)
+    if not fnmatch.fnmatchcase(domain, pattern_domain):
+        return False
+    open_ended = pattern_props.pop('*', None) is not None
+    for key, value in pattern_props.items():
+        if key not in props or not fnmatch.fnmatchcase(props[key], value):
+            return False
+    return open_ended or set(props) == set(pattern_props)
+
+
+def is_pattern(name):
+    return '*' in name or '?' in name
+
+
+class JolokiaError(Exception):
+    def __init__(self, status, error_type, message):
+        Exception.__init__(self, message)
+        self.status = status
+        self.error_type = error_type
+
+
+class MBeanRegistry(object):
+    """
+    mbean name -> attributes (a dict of name to value) and operations (a
+    dict of name to callable). Values can be any JSON-serializable object.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.mbeans = {}
+
+    def register(self, name, attributes=None, operations=None):
+        self.mbeans[name] = (dict(attributes or {}), dict(operations or {}))
+
+    def search(self, pattern):
+        return sorted(name for name in self.mbeans if name_matches(pattern, name))
+
+    def __get(self, name):
+        if name not in self.mbeans:
+            raise JolokiaError(404, 'javax.management.InstanceNotFoundException', name)
+        return self.mbeans[name]
+
+    def __attribute(self, name, attribute):
+        attributes = self.__get(name)[0]
+        if attribute not in attributes:
+            raise JolokiaError(404, 'javax.management.AttributeNotFoundException',
+                               'No attribute %s on %s' % (attribute, name))
+        return attributes[attribute]
+
+    def read(self, name, attribute=None):
+        with self.lock:
+            if is_pattern(name):
+                # like Jolokia, leave out matching mbeans that lack the attributes
+                wanted = [attribute] if isinstance(attribute, basestring) else attribute
+                names = [n for n in self.search(name)
+                         if wanted is None or all(a in self.mbeans[n][0] for a in wanted)]
+                if not names:
+                    raise JolokiaError(404, 'javax.management.InstanceNotFoundException', name)
+                return dict((n, self.__read_all(n, attribute)) for n in names)
+            if attribute is None or isinstance(attribute, list):
+                return self.__read_all(name, attribute)
+            return self.__attribute(name, attribute)
+
+    def __read_all(self, name, attributes):
+        if attributes is None:
+            return dict(self.__get(name)[0])
+        if not isinstance(attributes, list):
+            attributes = [attributes]
+        return dict((a, self.__attribute(name, a)) for a in attributes)
+
+    def write(self, name, attribute, value):
+        with self.lock:
+            old = self.__attribute(name, attribute)
+            self.mbeans[name][0][attribute] = value
+            return old
+
+    def execute(self, name, operation, arguments):
+        with self.lock:
+            operations = self.__get(name)[1]
+        if operation not in operations:
+            raise JolokiaError(404, 'java.lang.IllegalArgumentException',
+                               'No operation %s on %s' % (operation, name))
+        return operations[operation](*arguments)
+
+
+def follow_path(value, path):
+    """Follows a Jolokia path ('a/b/0') into nested dicts and lists."""
+    for part in path.split('/'):
+        if isinstance(value, list):
+            value = value[int(part)]
+        else:
+            value = value[part]
+    return value
+
+
+def handle_request(registry, request):
+    """Returns Jolokia's response to a single request (a dict)."""
+    try:
+        kind = request.get('type')
+        mbean = request.get('mbean')
+        if kind == 'read':
+            value = registry.read(mbean, request.get('attribute'))
+            if request.get('path'):
+                value = follow_path(value, request['path'])
+        elif kind == 'write':
+            value = registry.write(mbean, request['attribute'], request['value'])
+        elif kind == 'exec':
+            value = registry.execute(mbean, request['operation'], request.get('arguments', []))
+        elif kind == 'search':
+            value = registry.search(mbean)
+        elif kind == 'version':
+            value = {'agent': 'fake', 'protocol': '7.1'}
+        else:
+            raise JolokiaError(400, 'java.lang.IllegalArgumentException', 'Unknown request type %s' % (kind,))
+    except JolokiaError as e:
+        return {'status': e.status, 'error_type': e.error_type, 'error': '%s : %s' % (e.error_type, e), 'request': request}
+    except (KeyError, IndexError, TypeError, ValueError) as e:
+        return {'status': 400, 'error_type': type(e).__name__, 'error': str(e), 'request': request}
+    return {'status': 200, 'value': value, 'timestamp': int(time.time()), 'request': request}
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        # wfile sends in 8k chunks, don't let Nagle hold back the last one
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.connections_lock:
+            self.server.connections.add(self.request)
+
+    def finish(self):
+        with self.server.connections_lock:
+            self.server.connections.discard(self.request)
+        BaseHTTPServer.BaseHTTPRequestHandler.finish(self)
+
+    def do_POST(self):
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.getheader('content-length', 0))))
+        except ValueError as e:
+            return self.__reply(400, json.dumps({'status': 400, 'error': str(e)}))
+        if isinstance(body, list):
+            response = [handle_request(self.server.registry, request) for request in body]
+        else:
+            response = handle_request(self.server.registry, body)
+        self.server.requests += 1
+        self.__reply(200, json.dumps(response))
+
+    def __reply(self, code, payload):
+        head = 'HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n' \
+            % (code, self.responses[code][0], len(payload))
+        self.wfile.write(head + payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeJolokiaServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Serves `registry` on host:port (port 0 picks a free one, see `port`) from
+    a background thread, between start() and stop().
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, registry=None, host='127.0.0.1', port=0):
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port), _Handler)
+        self.registry = registry if registry is not None else MBeanRegistry()
+        self.host, self.port = self.server_address
+        self.requests = 0
+        self.connections = set()
+        self.connections_lock = threading.Lock()
+        self.__thread = None
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.serve_forever, name='fake-jolokia')
+        self.__thread.daemon = True
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self.__thread.join()
+
+    def handle_error(self, request, client_address):
+        # a client going away, or dropped by drop_connections(), isn't an error
+        if not isinstance(sys.exc_info()[1], socket.error):
+            BaseHTTPServer.HTTPServer.handle_error(self, request, client_address)
+
+    def drop_connections(self):
+        """Closes the open client connections, like an agent timing out idle ones."""
+        with self.connections_lock:
+            connections = list(self.connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, value, traceback):
+        self.stop()
+
+
+class FakeNode(object):
+    """Just enough of a ccm Node for JolokiaAgent and JolokiaAgents."""
+
+    def __init__(self, name='node1', host='127.0.0.1', pid=1):
+        self.name = name
+        self.pid = pid
+        self.network_interfaces = {'binary': (host, 9042)}
+
+    def get_path(self):
+        return '/fake/' + self.name
+
+    def is_running(self):
+        return True
+
+
+def _timer(count):
+    return {'Count': count, 'Mean': 250.0, '50thPercentile': 200.0, '99thPercentile': 900.0, 'OneMinuteRate': 10.0}
+
+
+def cassandra_registry(keyspaces=('ks',), tables=10):
+    """
+    A registry with mbeans named like a node's: per-table ColumnFamily
+    metrics, compaction, thread pool, client request and cache metrics, and
+    db:type=IndexSummaries with its operation.
+    """
+    registry = MBeanRegistry()
+    for keyspace in keyspaces:
+        for i in xrange(tables):
+            table = 'table%d' % i
+            for name, value in (('MemtableLiveDataSize', 1024 * i), ('MemtableColumnsCount', 10 * i),
+                                ('LiveSSTableCount', i % 4), ('PendingCompactions', 0)):
+                registry.register(make_mbean('metrics', 'ColumnFamily', keyspace=keyspace, scope=table, name=name),
+                                  {'Value': value})
+            registry.register(make_mbean('metrics', 'ColumnFamily', keyspace=keyspace, scope=table, name='ReadLatency'),
+                              _timer(100 * i))
+    registry.register(make_mbean('metrics', 'ColumnFamily', name='MemtableLiveDataSize'), {'Value': 0})
+    registry.register(make_mbean('metrics', 'Compaction', name='PendingTasks'), {'Value': 0})
+    registry.register(make_mbean('metrics', 'Compaction', name='CompletedTasks'), {'Value': 0})
+    for path, stages in (('request', ('MutationStage', 'ReadStage')), ('internal', ('CompactionExecutor',))):
+        for stage in stages:
+            registry.register(make_mbean('metrics', 'ThreadPools', path=path, scope=stage, name='PendingTasks'), {'Value': 0})
+            registry.register(make_mbean('metrics', 'ThreadPools', path=path, scope=stage, name='CurrentlyBlockedTasks'), {'Count': 0})
+    for scope in ('Read', 'Write'):
+        registry.register(make_mbean('metrics', 'ClientRequest', scope=scope, name='Latency'), _timer(0))
+    for scope in ('KeyCache', 'RowCache'):
+        registry.register(make_mbean('metrics', 'Cache', scope=scope, name='HitRate'), {'Value': 0.0})
+
+    def redistribute():
+        attributes = registry.mbeans[make_mbean('db', 'IndexSummaries')][0]
+        if attributes['MemoryPoolCapacityInMB'] == 0:
+            attributes['AverageIndexInterval'] = 2048.0
+    registry.register(make_mbean('db', 'IndexSummaries'),
+                      {'AverageIndexInterval': 128.0, 'MemoryPoolCapacityInMB': 100},
+                      {'redistributeSummaries': redistribute})
+    return registry
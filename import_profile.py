@@ -0,0 +1,91 @@
+"""
+Reports where the time goes when test modules are imported, which every test
+discovery and every single-test run pays before the first test starts.
+
+    python import_profile.py [module ...] [--top N]
+
+Without arguments, every test module in the current directory is imported.
+Modules are imported in the given order in one process, so a module's time
+doesn't include what an earlier module already imported. "total" includes
+the modules an import pulls in, "self" doesn't.
+"""
+import __builtin__
+import glob
+import os
+import sys
+import time
+from collections import defaultdict
+
+_real_import = __builtin__.__import__
+_stack = []
+# module -> [total seconds, self seconds]
+stats = defaultdict(lambda: [0.0, 0.0])
+
+
+def _profiled_import(name, *args, **kwargs):
+    loaded = len(sys.modules)
+    _stack.append(0.0)
+    start = time.time()
+    try:
+        return _real_import(name, *args, **kwargs)
+    finally:
+        elapsed = time.time() - start
+        children = _stack.pop()
+        if _stack:
+            _stack[-1] += elapsed
+        # only count imports that loaded something, not lookups in sys.modules
+        if len(sys.modules) > loaded:
+            stats[name][0] += elapsed
+            stats[name][1] += elapsed - children
+
+
+def test_modules():
+    files = set(glob.glob('*_test.py') + glob.glob('*_tests.py'))
+    return sorted(os.path.splitext(f)[0] for f in files)
+
+
+def profile(modules):
+    """Imports modules, returns [(module, seconds or exception)] in import order."""
+    results = []
+    __builtin__.__import__ = _profiled_import
+    try:
+        for module in modules:
+            start = time.time()
+            try:
+                _real_import(module)
+            except Exception as e:
+                results.append((module, e))
+                continue
+            results.append((module, time.time() - start))
+    finally:
+        __builtin__.__import__ = _real_import
+    return results
+
+
+def report(results, top=20, out=sys.stdout):
+    timed = [(m, t) for m, t in results if not isinstance(t, Exception)]
+    out.write("Imported %d modules in %.2fs\n\n" % (len(timed), sum(t for _, t in timed)))
+    out.write("Test modules, slowest first:\n")
+    for module, elapsed in sorted(timed, key=lambda item: -item[1])[:top]:
+        out.write("  %8.3fs  %s\n" % (elapsed, module))
+    failed = [(m, e) for m, e in results if isinstance(e, Exception)]
+    if failed:
+        out.write("\nFailed to import:\n")
+        for module, e in failed:
+            out.write("  %s: %s: %s\n" % (module, type(e).__name__, e))
+    out.write("\nImports by self time:\n")
+    out.write("  %8s  %8s\n" % ("self", "total"))
+    for name, (total, own) in sorted(stats.items(), key=lambda item: -item[1][1])[:top]:
+        out.write("  %7.3fs  %7.3fs  %s\n" % (own, total, name))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    top = 20
+    if '--top' in args:
+        i = args.index('--top')
+        top = int(args[i + 1])
+        del args[i:i + 2]
+    sys.path.insert(0, os.getcwd())
+    modules = [os.path.splitext(os.path.basename(a))[0] for a in args] or test_modules()
+    report(profile(modules), top=top)
@@ -3,7 +3,7 @@ from tools import since
 
 from cassandra.concurrent import execute_concurrent_with_args
 
-from jmxutils import JolokiaAgent, make_mbean
+from jmxutils import jolokia_agents, make_mbean
 
 
 class TestUpgradeIndexSummary(Tester):
@@ -49,18 +49,18 @@ class TestUpgradeIndexSummary(Tester):
         session = self.patient_cql_connection(node)
 
         mbean = make_mbean('db', 'IndexSummaries')
-        with JolokiaAgent(node) as jmx:
-            avg_interval = jmx.read_attribute(mbean, 'AverageIndexInterval')
-            self.assertEqual(128.0, avg_interval)
+        jmx = jolokia_agents.get(node)
+        avg_interval = jmx.read_attribute(mbean, 'AverageIndexInterval')
+        self.assertEqual(128.0, avg_interval)
 
-            # force downsampling of the index summary (if it were allowed)
-            jmx.write_attribute(mbean, 'MemoryPoolCapacityInMB', 0)
-            jmx.execute_method(mbean, 'redistributeSummaries')
+        # force downsampling of the index summary (if it were allowed)
+        jmx.write_attribute(mbean, 'MemoryPoolCapacityInMB', 0)
+        jmx.execute_method(mbean, 'redistributeSummaries')
 
-            avg_interval = jmx.read_attribute(mbean, 'AverageIndexInterval')
+        avg_interval = jmx.read_attribute(mbean, 'AverageIndexInterval')
 
-            # after downsampling, the average interval goes up
-            self.assertGreater(avg_interval, 128.0)
+        # after downsampling, the average interval goes up
+        self.assertGreater(avg_interval, 128.0)
 
         # upgrade to the latest 2.1+ by using the original install dir
         session.cluster.shutdown()
@@ -80,15 +80,15 @@ class TestUpgradeIndexSummary(Tester):
         session = self.patient_cql_connection(node)
 
         mbean = make_mbean('db', 'IndexSummaries')
-        with JolokiaAgent(node) as jmx:
-            avg_interval = jmx.read_attribute(mbean, 'AverageIndexInterval')
-            self.assertEqual(128.0, avg_interval)
+        jmx = jolokia_agents.get(node)
+        avg_interval = jmx.read_attribute(mbean, 'AverageIndexInterval')
+        self.assertEqual(128.0, avg_interval)
 
-            # force downsampling of the index summary (if it were allowed)
-            jmx.write_attribute(mbean, 'MemoryPoolCapacityInMB', 0)
-            jmx.execute_method(mbean, 'redistributeSummaries')
+        # force downsampling of the index summary (if it were allowed)
+        jmx.write_attribute(mbean, 'MemoryPoolCapacityInMB', 0)
+        jmx.execute_method(mbean, 'redistributeSummaries')
 
-            avg_interval = jmx.read_attribute(mbean, 'AverageIndexInterval')
+        avg_interval = jmx.read_attribute(mbean, 'AverageIndexInterval')
 
-            # post-8993, it shouldn't allow downsampling of old-format sstables
-            self.assertEqual(128.0, avg_interval)
+        # post-8993, it shouldn't allow downsampling of old-format sstables
+        self.assertEqual(128.0, avg_interval)
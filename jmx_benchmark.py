@@ -0,0 +1,67 @@
+"""
+Measures JolokiaAgent's request throughput and latency against a
+FakeJolokiaServer, so the JMX client can be tuned without a node:
+
+    python jmx_benchmark.py [seconds per case] [tables]
+
+Each case makes the same call in a loop for the given time (1s by default)
+and reports calls per second, mbean operations per second and per-call
+latency percentiles. The registry has `tables` tables (10 by default), whose
+metrics the bulk and pattern cases read.
+"""
+import sys
+import time
+
+from fake_jolokia import FakeJolokiaServer, FakeNode, cassandra_registry
+from jmxutils import JolokiaAgent, make_mbean
+
+
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def run_case(call, seconds):
+    """Calls call() for `seconds`, returns the sorted latency of each call."""
+    latencies = []
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        start = time.time()
+        call()
+        latencies.append(time.time() - start)
+    return sorted(latencies)
+
+
+def cases(jmx, tables):
+    table_reads = [(make_mbean('metrics', 'ColumnFamily', keyspace='ks', scope='table%d' % i, name='MemtableLiveDataSize'), 'Value')
+                   for i in xrange(tables)]
+    index_summaries = make_mbean('db', 'IndexSummaries')
+    pattern = 'org.apache.cassandra.metrics:type=ColumnFamily,keyspace=ks,*'
+    pattern_size = len(jmx.read_pattern(pattern, 'Value'))
+    return [
+        # name, operations per call, call
+        ('read_attribute', 1, lambda: jmx.read_attribute(index_summaries, 'AverageIndexInterval')),
+        ('read_attribute x%d' % tables, tables, lambda: [jmx.read_attribute(m, a) for m, a in table_reads]),
+        ('read_attributes (%d)' % tables, tables, lambda: jmx.read_attributes(table_reads)),
+        ('read_pattern (%d mbeans)' % pattern_size, pattern_size, lambda: jmx.read_pattern(pattern, 'Value')),
+        ('execute_method', 1, lambda: jmx.execute_method(index_summaries, 'redistributeSummaries')),
+        ('execute_methods (%d)' % tables, tables, lambda: jmx.execute_methods([(index_summaries, 'redistributeSummaries')] * tables)),
+    ]
+
+
+def benchmark(seconds=1.0, tables=10, out=sys.stdout):
+    with FakeJolokiaServer(cassandra_registry(tables=tables)) as server:
+        jmx = JolokiaAgent(FakeNode(host=server.host), port=server.port)
+        out.write("%-28s %10s %10s %9s %9s %9s\n" % ('case', 'calls/s', 'ops/s', 'p50 ms', 'p99 ms', 'max ms'))
+        for name, operations, call in cases(jmx, tables):
+            latencies = run_case(call, seconds)
+            rate = len(latencies) / sum(latencies)
+            out.write("%-28s %10.0f %10.0f %9.2f %9.2f %9.2f\n" % (
+                name, rate, rate * operations, percentile(latencies, 0.5) * 1000,
+                percentile(latencies, 0.99) * 1000, latencies[-1] * 1000))
+        jmx.close()
+        out.write("\n%d HTTP requests, agent stats: %s\n" % (server.requests, jmx.stats))
+
+
+if __name__ == '__main__':
+    benchmark(seconds=float(sys.argv[1]) if len(sys.argv) > 1 else 1.0,
+              tables=int(sys.argv[2]) if len(sys.argv) > 2 else 10)
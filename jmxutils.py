@@ -1,9 +1,19 @@
-from urllib2 import urlopen
+import httplib
 import json
 import os
+import socket
 import subprocess
+import threading
+import time
+
+import timings
 
 JOLOKIA_JAR = os.path.join('lib', 'jolokia-jvm-1.2.3-agent.jar')
+JOLOKIA_PORT = 8778
+# seconds to wait for the agent to answer a request
+DEFAULT_TIMEOUT = 10.0
+# request types that can safely be sent twice
+IDEMPOTENT_REQUESTS = ('read', 'search', 'list', 'version')
 
 
 def make_mbean(package, type, **kwargs):
@@ -30,6 +40,31 @@ def make_mbean(package, type, **kwargs):
     return rv
 
 
+def _read_key(read):
+    return tuple(tuple(part) if isinstance(part, list) else part for part in read)
+
+
+class RequestStats(object):
+    """ Number, total and worst latency (in seconds) of an agent's requests. """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def __repr__(self):
+        return '%d requests, %.1fms mean, %.1fms max' % (self.count, self.mean * 1000, self.max * 1000)
+
+
 class JolokiaAgent(object):
     """
     This class provides a simple way to read, write, and execute
@@ -43,12 +78,22 @@ class JolokiaAgent(object):
             avg_interval = jmx.read_attribute(mbean, 'AverageIndexInterval')
             jmx.write_attribute(mbean, 'MemoryPoolCapacityInMB', 0)
             jmx.execute_method(mbean, 'redistributeSummaries')
+
+    Requests go over one keep-alive HTTP connection, reopened if the agent
+    closed it. `stats` keeps their latencies, which are also added to the
+    current test's timings (see timings.py) as JolokiaAgent.request.
     """
 
     node = None
 
-    def __init__(self, node):
+    def __init__(self, node, timeout=DEFAULT_TIMEOUT, port=JOLOKIA_PORT):
         self.node = node
+        self.timeout = timeout
+        self.port = port
+        self.stats = RequestStats()
+        self.__connection = None
+        # one request at a time on the connection
+        self.__lock = threading.Lock()
 
     def start(self):
         """
@@ -58,6 +103,7 @@ class JolokiaAgent(object):
         args = ('java',
                 '-jar', JOLOKIA_JAR,
                 '--host', self.node.network_interfaces['binary'][0],
+                '--port', str(self.port),
                 'start', str(self.node.pid))
         try:
             subprocess.check_output(args, stderr=subprocess.STDOUT)
@@ -71,6 +117,7 @@ class JolokiaAgent(object):
         """
         Stops the Jolokia agent.
         """
+        self.close()
         args = ('java',
                 '-jar', JOLOKIA_JAR,
                 'stop', str(self.node.pid))
@@ -82,15 +129,59 @@ class JolokiaAgent(object):
             print "Output was: %s" % (exc.output,)
             raise
 
-    def _query(self, body):
-        request_data = json.dumps(body)
-        url = 'http://%s:8778/jolokia/' % (self.node.network_interfaces['binary'][0],)
-        response = urlopen(url, data=request_data, timeout=10.0)
-        if response.code != 200:
-            raise Exception("Failed to query Jolokia agent; HTTP response code: %d; response: %s" % (response.code, response.readlines()))
+    def close(self):
+        """
+        Closes the HTTP connection to the agent, the next request opens a new one.
+        """
+        if self.__connection is not None:
+            self.__connection.close()
+            self.__connection = None
 
-        raw_response = response.readline()
-        response = json.loads(raw_response)
+    def __request(self, request_data, idempotent):
+        """
+        Posts request_data. If a reused connection turns out to be closed,
+        the request is sent again on a new one, unless it may have reached
+        the agent already and isn't idempotent (it executes operations).
+        """
+        reused = self.__connection is not None
+        if not reused:
+            self.__connection = httplib.HTTPConnection(self.node.network_interfaces['binary'][0], self.port, timeout=self.timeout)
+        sent = False
+        try:
+            self.__connection.request('POST', '/jolokia/', request_data, {'Content-Type': 'application/json'})
+            sent = True
+            response = self.__connection.getresponse()
+            # the whole body has to be read before the connection can be reused
+            raw_response = response.read()
+        except socket.timeout:
+            self.close()
+            raise
+        except (httplib.HTTPException, socket.error):
+            self.close()
+            if not reused or (sent and not idempotent):
+                raise
+            # the agent closed the idle connection, retry once on a new one
+            return self.__request(request_data, idempotent)
+        if response.will_close:
+            self.close()
+        return response.status, raw_response
+
+    def _post(self, body):
+        request_data = json.dumps(body)
+        requests = body if isinstance(body, list) else [body]
+        idempotent = all(request['type'] in IDEMPOTENT_REQUESTS for request in requests)
+        with self.__lock:
+            start = time.time()
+            status, raw_response = self.__request(request_data, idempotent)
+            elapsed = time.time() - start
+            self.stats.record(elapsed)
+        timings.record_call('JolokiaAgent.request', elapsed)
+        if status != 200:
+            raise Exception("Failed to query Jolokia agent; HTTP response code: %d; response: %s" % (status, raw_response))
+
+        return json.loads(raw_response)
+
+    def _check(self, response):
         if response['status'] != 200:
             stacktrace = response.get('stacktrace')
             if stacktrace:
@@ -100,6 +191,22 @@ class JolokiaAgent(object):
             raise Exception("Jolokia agent returned non-200 status: %s" % (response,))
         return response
 
+    def _query(self, body):
+        return self._check(self._post(body))
+
+    def _query_bulk(self, bodies, ignore_errors=False):
+        """
+        Sends a list of requests in a single round trip, Jolokia answers
+        with a list of responses in the same order. With ignore_errors,
+        failed requests get None instead of raising.
+        """
+        if not bodies:
+            return []
+        responses = self._post(bodies)
+        if ignore_errors:
+            return [response if response['status'] == 200 else None for response in responses]
+        return [self._check(response) for response in responses]
+
     def read_attribute(self, mbean, attribute, path=None):
         """
         Reads a single JMX attribute.
@@ -166,6 +273,78 @@ class JolokiaAgent(object):
         response = self._query(body)
         return response['value']
 
+    def read_attributes(self, reads, ignore_errors=False):
+        """
+        Reads any number of JMX attributes in a single request.
+
+        `reads` is a list of (mbean, attribute) or (mbean, attribute, path)
+        tuples. `attribute` can also be a list of attribute names, or None
+        for all of the mbean's attributes, in which case the value is a
+        dict of attribute name to value.
+
+        Returns a dict mapping each tuple of `reads` to its value (a list
+        of attribute names is turned into a tuple in the key). With
+        ignore_errors, reads that fail (e.g. an mbean this version doesn't
+        have) are left out rather than raising.
+        """
+        bodies = []
+        for read in reads:
+            mbean, attribute = read[:2]
+            body = {'type': 'read', 'mbean': mbean}
+            if attribute is not None:
+                body['attribute'] = attribute
+            if len(read) > 2 and read[2]:
+                body['path'] = read[2]
+            bodies.append(body)
+        responses = self._query_bulk(bodies, ignore_errors=ignore_errors)
+        return dict((_read_key(read), response['value']) for read, response in zip(reads, responses)
+                    if response is not None)
+
+    def read_pattern(self, pattern, attribute=None):
+        """
+        Reads an attribute (or all attributes, if `attribute` is None) of
+        every mbean whose name matches `pattern`, in a single request.
+
+        Example patterns:
+
+            'org.apache.cassandra.metrics:type=ColumnFamily,keyspace=ks,*'
+            make_mbean('metrics', type='ThreadPools', path='request', scope='*', name='PendingTasks')
+
+        Returns a dict of mbean name to a dict of attribute name to value.
+        """
+        return self.read_patterns([pattern], attribute)[pattern]
+
+    def read_patterns(self, patterns, attribute=None):
+        """
+        Like read_pattern() for several patterns in a single request.
+        Returns a dict of pattern to read_pattern()'s result.
+        """
+        values = self.read_attributes([(pattern, attribute) for pattern in patterns])
+        return dict((pattern, values[_read_key((pattern, attribute))]) for pattern in patterns)
+
+    def search(self, pattern):
+        """
+        Returns the names of the mbeans matching `pattern`.
+        """
+        response = self._query({'type': 'search', 'mbean': pattern})
+        return response['value']
+
+    def execute_methods(self, calls):
+        """
+        Executes any number of JMX methods in a single request.
+
+        `calls` is a list of (mbean, operation) or (mbean, operation,
+        arguments) tuples, see execute_method().
+
+        Returns the methods' results, in the order of `calls`.
+        """
+        bodies = [{'type': 'exec',
+                   'mbean': call[0],
+                   'operation': call[1],
+                   'arguments': call[2] if len(call) > 2 and call[2] is not None else []}
+                  for call in calls]
+        return [response['value'] for response in self._query_bulk(bodies)]
+
     def __enter__(self):
         """ For contextmanager-style usage. """
         self.start()
@@ -175,3 +354,62 @@ class JolokiaAgent(object):
         """ For contextmanager-style usage. """
         self.stop()
         return exc_type is None
+
+
+class JolokiaAgents(object):
+    """
+    Keeps one attached Jolokia agent per node process, so that reading a
+    metric doesn't cost two JVM launches and an attach.
+
+    get(node) attaches an agent the first time it's asked for a node, and
+    again once the node has been restarted (its pid changed). Agents stay
+    attached until the cluster is torn down: Tester forgets the agents of
+    the nodes it kills, and detach() stops those of nodes that keep running.
+
+    Example usage:
+
+        jmx = jolokia_agents.get(node)
+        avg_interval = jmx.read_attribute(make_mbean('db', 'IndexSummaries'), 'AverageIndexInterval')
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        # node path -> (pid the agent is attached to, JolokiaAgent)
+        self.__agents = {}
+
+    def get(self, node):
+        key = node.get_path()
+        with self.__lock:
+            entry = self.__agents.get(key)
+            if entry is None or entry[0] != node.pid:
+                if entry is not None:
+                    entry[1].close()
+                agent = JolokiaAgent(node)
+                agent.start()
+                entry = self.__agents[key] = (node.pid, agent)
+            return entry[1]
+
+    def detach(self, nodes):
+        """ Stops the agents attached to running nodes, and forgets them. """
+        for node in nodes:
+            with self.__lock:
+                entry = self.__agents.pop(node.get_path(), None)
+            if entry is None:
+                continue
+            if entry[0] == node.pid and node.is_running():
+                try:
+                    entry[1].stop()
+                except subprocess.CalledProcessError:
+                    pass
+            else:
+                entry[1].close()
+
+    def forget(self, nodes):
+        """ Forgets the agents of nodes that are being stopped, their agents stop with them. """
+        with self.__lock:
+            entries = [self.__agents.pop(node.get_path(), None) for node in nodes]
+        for entry in entries:
+            if entry is not None:
+                entry[1].close()
+
+jolokia_agents = JolokiaAgents()
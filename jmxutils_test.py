@@ -0,0 +1,112 @@
+"""
+Tests of the JMX client in jmxutils against fake_jolokia's stand-in agent,
+so they run without a node or Java.
+"""
+import unittest
+
+from fake_jolokia import FakeJolokiaServer, FakeNode, cassandra_registry
+from jmxutils import JolokiaAgent, make_mbean
+
+INDEX_SUMMARIES = make_mbean('db', 'IndexSummaries')
+
+
+def table_mbean(table, name='MemtableLiveDataSize'):
+    return make_mbean('metrics', 'ColumnFamily', keyspace='ks', scope=table, name=name)
+
+
+class TestJolokiaAgent(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeJolokiaServer(cassandra_registry(tables=3)).start()
+        self.jmx = JolokiaAgent(FakeNode(host=self.server.host), port=self.server.port)
+
+    def tearDown(self):
+        self.jmx.close()
+        self.server.stop()
+
+    def read_test(self):
+        self.assertEqual(128.0, self.jmx.read_attribute(INDEX_SUMMARIES, 'AverageIndexInterval'))
+        self.assertEqual(900.0, self.jmx.read_attribute(table_mbean('table1', 'ReadLatency'), '99thPercentile'))
+
+        self.jmx.write_attribute(INDEX_SUMMARIES, 'MemoryPoolCapacityInMB', 0)
+        self.assertEqual(0, self.jmx.read_attribute(INDEX_SUMMARIES, 'MemoryPoolCapacityInMB'))
+
+        with self.assertRaises(Exception):
+            self.jmx.read_attribute(make_mbean('db', 'NoSuchBean'), 'Value')
+
+    def bulk_read_test(self):
+        reads = [(table_mbean('table%d' % i), 'Value') for i in xrange(3)]
+        reads.append((INDEX_SUMMARIES, ['AverageIndexInterval', 'MemoryPoolCapacityInMB']))
+        values = self.jmx.read_attributes(reads)
+
+        self.assertEqual(1, self.server.requests)
+        self.assertEqual({(table_mbean('table0'), 'Value'): 0,
+                          (table_mbean('table1'), 'Value'): 1024,
+                          (table_mbean('table2'), 'Value'): 2048,
+                          (INDEX_SUMMARIES, ('AverageIndexInterval', 'MemoryPoolCapacityInMB')):
+                              {'AverageIndexInterval': 128.0, 'MemoryPoolCapacityInMB': 100}},
+                         values)
+
+    def bulk_read_errors_test(self):
+        reads = [(table_mbean('table0'), 'Value'), (make_mbean('db', 'NoSuchBean'), 'Value')]
+        with self.assertRaises(Exception):
+            self.jmx.read_attributes(reads)
+        self.assertEqual({(table_mbean('table0'), 'Value'): 0},
+                         self.jmx.read_attributes(reads, ignore_errors=True))
+
+    def pattern_test(self):
+        sizes = self.jmx.read_pattern(table_mbean('*'), 'Value')
+        self.assertEqual(dict((table_mbean('table%d' % i), {'Value': 1024 * i}) for i in xrange(3)), sizes)
+
+        pending = make_mbean('metrics', 'ThreadPools', path='request', scope='*', name='PendingTasks')
+        both = self.jmx.read_patterns([table_mbean('*'), pending], 'Value')
+        self.assertEqual(sizes, both[table_mbean('*')])
+        self.assertEqual(2, len(both[pending]))
+
+    def search_test(self):
+        names = self.jmx.search('org.apache.cassandra.metrics:type=ColumnFamily,keyspace=ks,scope=table1,*')
+        self.assertEqual(sorted(table_mbean('table1', name) for name in
+                                ('MemtableLiveDataSize', 'MemtableColumnsCount', 'LiveSSTableCount',
+                                 'PendingCompactions', 'ReadLatency')),
+                         names)
+        self.assertEqual([], self.jmx.search(make_mbean('db', 'NoSuchBean')))
+
+    def execute_test(self):
+        self.jmx.write_attribute(INDEX_SUMMARIES, 'MemoryPoolCapacityInMB', 0)
+        self.assertEqual(None, self.jmx.execute_method(INDEX_SUMMARIES, 'redistributeSummaries'))
+        self.assertEqual(2048.0, self.jmx.read_attribute(INDEX_SUMMARIES, 'AverageIndexInterval'))
+
+        requests = self.server.requests
+        self.assertEqual([None] * 3, self.jmx.execute_methods([(INDEX_SUMMARIES, 'redistributeSummaries')] * 3))
+        self.assertEqual(requests + 1, self.server.requests)
+
+        with self.assertRaises(Exception):
+            self.jmx.execute_method(INDEX_SUMMARIES, 'noSuchOperation')
+
+    def keep_alive_test(self):
+        for _ in xrange(5):
+            self.jmx.read_attribute(INDEX_SUMMARIES, 'AverageIndexInterval')
+        self.assertEqual(5, self.jmx.stats.count)
+        self.assertEqual(1, len(self.server.connections))
+
+    def reconnect_after_idle_close_test(self):
+        self.jmx.read_attribute(INDEX_SUMMARIES, 'AverageIndexInterval')
+        self.server.drop_connections()
+
+        self.assertEqual(128.0, self.jmx.read_attribute(INDEX_SUMMARIES, 'AverageIndexInterval'))
+        self.assertEqual(2, self.server.requests)
+
+    def no_exec_resent_after_lost_response_test(self):
+        calls = []
+
+        def increment():
+            calls.append(1)
+            # the operation ran, but the agent goes away before answering
+            self.server.drop_connections()
+        counter = make_mbean('db', 'Counter')
+        self.server.registry.register(counter, operations={'increment': increment})
+        self.jmx.read_attribute(INDEX_SUMMARIES, 'AverageIndexInterval')
+
+        with self.assertRaises(Exception):
+            self.jmx.execute_method(counter, 'increment')
+        self.assertEqual(1, len(calls))
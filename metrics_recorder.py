@@ -0,0 +1,191 @@
+"""
+Background recording of node metrics over JMX.
+
+A MetricsRecorder polls a set of mbean attributes on every running node, with
+one bulk request per node through the shared Jolokia agents, and keeps each
+node's series of samples in arrays of doubles. Tests can then wait on, or
+assert about, how a metric evolved instead of sleeping and reading it once:
+
+    recorder = self.record_metrics(interval=0.5)
+    ...
+    recorder.wait_until_metric('pending_compactions', lambda pending: pending == 0, timeout=120)
+    assert recorder.series('node1', 'key_cache_hit_rate').last() > 0.9
+
+With RECORD_METRICS set to an interval in seconds, Tester records
+DEFAULT_METRICS during every test, and logs a per-node summary at tearDown
+and adds it to the test's timings record.
+"""
+import threading
+import time
+from array import array
+
+from jmxutils import jolokia_agents, make_mbean
+
+
+def _metric(package, type, attribute='Value', **kwargs):
+    return make_mbean(package, type, **kwargs), attribute
+
+# (series name, mbean, attribute); mbeans a node's version doesn't have are skipped
+DEFAULT_METRICS = [
+    ('memtable_live_bytes',) + _metric('metrics', 'ColumnFamily', name='MemtableLiveDataSize'),
+    ('pending_compactions',) + _metric('metrics', 'Compaction', name='PendingTasks'),
+    ('completed_compactions',) + _metric('metrics', 'Compaction', name='CompletedTasks'),
+    ('mutation_pending',) + _metric('metrics', 'ThreadPools', path='request', scope='MutationStage', name='PendingTasks'),
+    ('mutation_blocked',) + _metric('metrics', 'ThreadPools', 'Count', path='request', scope='MutationStage', name='CurrentlyBlockedTasks'),
+    ('read_pending',) + _metric('metrics', 'ThreadPools', path='request', scope='ReadStage', name='PendingTasks'),
+    ('read_blocked',) + _metric('metrics', 'ThreadPools', 'Count', path='request', scope='ReadStage', name='CurrentlyBlockedTasks'),
+    ('compaction_pending',) + _metric('metrics', 'ThreadPools', path='internal', scope='CompactionExecutor', name='PendingTasks'),
+    ('read_count',) + _metric('metrics', 'ClientRequest', 'Count', scope='Read', name='Latency'),
+    ('read_latency_p99',) + _metric('metrics', 'ClientRequest', '99thPercentile', scope='Read', name='Latency'),
+    ('write_count',) + _metric('metrics', 'ClientRequest', 'Count', scope='Write', name='Latency'),
+    ('write_latency_p99',) + _metric('metrics', 'ClientRequest', '99thPercentile', scope='Write', name='Latency'),
+    ('key_cache_hit_rate',) + _metric('metrics', 'Cache', scope='KeyCache', name='HitRate'),
+    ('row_cache_hit_rate',) + _metric('metrics', 'Cache', scope='RowCache', name='HitRate'),
+]
+
+
+class Series(object):
+    """The samples of one metric on one node, as arrays of times and values."""
+
+    def __init__(self):
+        self.times = array('d')
+        self.values = array('d')
+
+    def append(self, when, value):
+        self.times.append(when)
+        self.values.append(value)
+
+    def __len__(self):
+        return len(self.values)
+
+    def last(self):
+        return self.values[-1] if self.values else None
+
+    def since(self, when):
+        """Returns the values sampled at or after time `when`."""
+        for i, t in enumerate(self.times):
+            if t >= when:
+                return self.values[i:]
+        return array('d')
+
+    def rate(self):
+        """Change of the value per second over the whole series, for counters."""
+        if len(self) < 2 or self.times[-1] == self.times[0]:
+            return 0.0
+        return (self.values[-1] - self.values[0]) / (self.times[-1] - self.times[0])
+
+    def summary(self):
+        values = self.values
+        if not values:
+            return {'samples': 0}
+        return {
+            'samples': len(values),
+            'min': min(values),
+            'max': max(values),
+            'mean': sum(values) / len(values),
+            'last': values[-1],
+            'rate': self.rate(),
+        }
+
+
+class MetricsRecorder(threading.Thread):
+    """
+    Every `interval` seconds, reads `metrics` (a list of (name, mbean,
+    attribute)) on each running node returned by `nodes`, a callable so that
+    nodes added or clusters swapped during the test are followed, until
+    stop() is called. Non-numeric values and failed reads are skipped.
+    """
+
+    def __init__(self, nodes, metrics=None, interval=1.0, agents=jolokia_agents):
+        threading.Thread.__init__(self, name='dtest-metrics-recorder')
+        self.daemon = True
+        self.nodes = nodes
+        self.metrics = list(metrics if metrics is not None else DEFAULT_METRICS)
+        self.interval = interval
+        self.agents = agents
+        # (node name, metric name) -> Series
+        self.all_series = {}
+        self.errors = 0
+        self.__sampled = threading.Condition()
+        self.__stopped = threading.Event()
+
+    def run(self):
+        while not self.__stopped.is_set():
+            self.sample()
+            self.__stopped.wait(self.interval)
+
+    def sample(self):
+        reads = [(mbean, attribute) for _, mbean, attribute in self.metrics]
+        for node in self.nodes():
+            if not node.is_running():
+                continue
+            try:
+                values = self.agents.get(node).read_attributes(reads, ignore_errors=True)
+            except Exception:
+                # the node may be starting or stopping, or the agent can't attach
+                self.errors += 1
+                continue
+            now = time.time()
+            with self.__sampled:
+                for name, mbean, attribute in self.metrics:
+                    value = values.get((mbean, attribute))
+                    if isinstance(value, (int, long, float)):
+                        self.series(node.name, name).append(now, float(value))
+                self.__sampled.notify_all()
+
+    def stop(self):
+        self.__stopped.set()
+        if self.is_alive():
+            self.join()
+
+    def series(self, node_name, metric):
+        """The Series of metric on node_name, empty if it wasn't sampled (yet)."""
+        key = (node_name, metric)
+        if key not in self.all_series:
+            self.all_series[key] = Series()
+        return self.all_series[key]
+
+    def latest(self, metric):
+        """Returns {node name: last value of metric} for the nodes it was sampled on."""
+        with self.__sampled:
+            return dict((node_name, series.last()) for (node_name, name), series in self.all_series.items()
+                        if name == metric and len(series))
+
+    def wait_until_metric(self, metric, predicate, node=None, timeout=60):
+        """
+        Waits until predicate(value) holds for the last sampled value of
+        metric on `node` (a node or its name), or if no node is given on
+        every running node. Returns the last values, by node name. Raises
+        an AssertionError after `timeout` seconds.
+        """
+        node_name = getattr(node, 'name', node)
+        deadline = time.time() + timeout
+        with self.__sampled:
+            while True:
+                if node_name is not None:
+                    names = [node_name]
+                else:
+                    names = [n.name for n in self.nodes() if n.is_running()]
+                latest = dict((name, self.series(name, metric).last()) for name in names)
+                if names and all(value is not None and predicate(value) for value in latest.values()):
+                    return latest
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise AssertionError("%s didn't reach the expected value in %ss, last values: %s" % (metric, timeout, latest))
+                self.__sampled.wait(min(remaining, self.interval * 2))
+
+    def summary(self):
+        """Returns {node name: {metric: Series.summary()}} for the metrics sampled."""
+        result = {}
+        with self.__sampled:
+            for (node_name, metric), series in sorted(self.all_series.items()):
+                if len(series):
+                    result.setdefault(node_name, {})[metric] = series.summary()
+        return result
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, value, traceback):
+        self.stop()
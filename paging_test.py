@@ -7,7 +7,7 @@ from cassandra.query import SimpleStatement, dict_factory
 from dtest import Tester, run_scenarios
 from tools import since
 
-from datahelp import create_rows, parse_data_into_dicts, flatten_into_set
+from datahelp import create_rows, parse_data_into_dicts, flatten_into_set, compare_rows
 
 class Page(object):
     data = None
@@ -163,7 +163,9 @@ class PageFetcher(object):
 class PageAssertionMixin(object):
     """Can be added to subclasses of unittest.Tester"""
     def assertEqualIgnoreOrder(self, actual, expected):
-        return self.assertItemsEqual(actual, expected)
+        difference = compare_rows(actual, expected)
+        if difference is not None:
+            raise self.failureException("Rows differ, ignoring order: " + difference)
 
     def assertIsSubsetOf(self, subset, superset):
         assert flatten_into_set(subset).issubset(flatten_into_set(superset))
@@ -505,7 +507,8 @@ class TestPagingWithModifiers(BasePagingTester, PageAssertionMixin):
             # make sure all the data retrieved is a subset of input data
             self.assertIsSubsetOf(pf.all_data(), expected_data)
 
-        run_scenarios(scenarios, handle_scenario, deferred_exceptions=(AssertionError,))
+        # the scenarios only read, so they can run side by side
+        run_scenarios(scenarios, handle_scenario, deferred_exceptions=(AssertionError,), workers=4)
 
     def test_with_allow_filtering(self):
         cursor = self.prepare()
@@ -958,14 +961,14 @@ class TestPagingQueryIsolation(BasePagingTester, PageAssertionMixin):
         self.assertEqual(page_fetchers[9].pagecount(), 4)
         self.assertEqual(page_fetchers[10].pagecount(), 34)
 
-        self.assertEqualIgnoreOrder(flatten_into_set(page_fetchers[0].all_data()), flatten_into_set(expected_data[:5000]))
-        self.assertEqualIgnoreOrder(flatten_into_set(page_fetchers[1].all_data()), flatten_into_set(expected_data[5000:10000]))
-        self.assertEqualIgnoreOrder(flatten_into_set(page_fetchers[2].all_data()), flatten_into_set(expected_data[10000:15000]))
-        self.assertEqualIgnoreOrder(flatten_into_set(page_fetchers[3].all_data()), flatten_into_set(expected_data[15000:20000]))
-        self.assertEqualIgnoreOrder(flatten_into_set(page_fetchers[4].all_data()), flatten_into_set(expected_data[20000:25000]))
-        self.assertEqualIgnoreOrder(flatten_into_set(page_fetchers[5].all_data()), flatten_into_set(expected_data[:5000]))
-        self.assertEqualIgnoreOrder(flatten_into_set(page_fetchers[6].all_data()), flatten_into_set(expected_data[5000:10000]))
-        self.assertEqualIgnoreOrder(flatten_into_set(page_fetchers[7].all_data()), flatten_into_set(expected_data[10000:15000]))
-        self.assertEqualIgnoreOrder(flatten_into_set(page_fetchers[8].all_data()), flatten_into_set(expected_data[15000:20000]))
-        self.assertEqualIgnoreOrder(flatten_into_set(page_fetchers[9].all_data()), flatten_into_set(expected_data[20000:25000]))
-        self.assertEqualIgnoreOrder(flatten_into_set(page_fetchers[10].all_data()), flatten_into_set(expected_data[:50000]))
+        self.assertEqualIgnoreOrder(page_fetchers[0].all_data(), expected_data[:5000])
+        self.assertEqualIgnoreOrder(page_fetchers[1].all_data(), expected_data[5000:10000])
+        self.assertEqualIgnoreOrder(page_fetchers[2].all_data(), expected_data[10000:15000])
+        self.assertEqualIgnoreOrder(page_fetchers[3].all_data(), expected_data[15000:20000])
+        self.assertEqualIgnoreOrder(page_fetchers[4].all_data(), expected_data[20000:25000])
+        self.assertEqualIgnoreOrder(page_fetchers[5].all_data(), expected_data[:5000])
+        self.assertEqualIgnoreOrder(page_fetchers[6].all_data(), expected_data[5000:10000])
+        self.assertEqualIgnoreOrder(page_fetchers[7].all_data(), expected_data[10000:15000])
+        self.assertEqualIgnoreOrder(page_fetchers[8].all_data(), expected_data[15000:20000])
+        self.assertEqualIgnoreOrder(page_fetchers[9].all_data(), expected_data[20000:25000])
+        self.assertEqualIgnoreOrder(page_fetchers[10].all_data(), expected_data[:50000])
@@ -0,0 +1,167 @@
+"""
+Background sampling of node process resources.
+
+With SAMPLE_NODES set to an interval in seconds, Tester starts a
+ResourceSampler for every test. It reads /proc/<pid>/stat and
+/proc/<pid>/io of each running node, including nodes added during the test,
+and keeps the samples in a fixed-size ring buffer per node process, so that a
+restarted node's counters start over in a buffer of their own. At tearDown
+the per-node summary is logged and added to the test's timings record.
+
+Only Linux has /proc; elsewhere the sampler records nothing.
+"""
+import os
+import threading
+import time
+from array import array
+
+FIELDS = ('time', 'cpu', 'rss', 'threads', 'read_bytes', 'write_bytes')
+
+try:
+    CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError):
+    CLOCK_TICKS = PAGE_SIZE = None
+
+
+def read_process(pid):
+    """
+    Returns (cpu seconds, rss bytes, threads, read bytes, write bytes) for pid,
+    or None if the process is gone. I/O counters are -1 when /proc/<pid>/io
+    can't be read.
+    """
+    try:
+        with open('/proc/%d/stat' % pid) as f:
+            stat = f.read()
+    except IOError:
+        return None
+    # the command name can contain spaces, fields are counted from its closing parenthesis
+    fields = stat[stat.rindex(')') + 2:].split()
+    cpu = (int(fields[11]) + int(fields[12])) / float(CLOCK_TICKS)
+    threads = int(fields[17])
+    rss = int(fields[21]) * PAGE_SIZE
+
+    read_bytes = write_bytes = -1
+    try:
+        with open('/proc/%d/io' % pid) as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key == 'read_bytes':
+                    read_bytes = int(value)
+                elif key == 'write_bytes':
+                    write_bytes = int(value)
+    except IOError:
+        pass
+    return cpu, rss, threads, read_bytes, write_bytes
+
+
+class RingBuffer(object):
+    """Keeps the last `capacity` samples of FIELDS in one array of doubles per field."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.columns = dict((field, array('d', [0.0] * capacity)) for field in FIELDS)
+        self.count = 0
+
+    def append(self, values):
+        i = self.count % self.capacity
+        for field, value in zip(FIELDS, values):
+            self.columns[field][i] = value
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def column(self, field):
+        """Returns the samples of field, oldest first."""
+        data = self.columns[field]
+        if self.count <= self.capacity:
+            return data[:self.count]
+        i = self.count % self.capacity
+        return data[i:] + data[:i]
+
+
+class ResourceSampler(threading.Thread):
+    """
+    Samples the processes of the nodes returned by `nodes` (a callable, so
+    that nodes added or clusters swapped during the test are followed) every
+    `interval` seconds until stop() is called.
+    """
+
+    def __init__(self, nodes, interval=1.0, capacity=3600):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.nodes = nodes
+        self.interval = interval
+        self.capacity = capacity
+        # (node name, pid) -> RingBuffer
+        self.buffers = {}
+        self.__stopped = threading.Event()
+
+    def run(self):
+        if CLOCK_TICKS is None or not os.path.isdir('/proc'):
+            return
+        while not self.__stopped.is_set():
+            self.sample()
+            self.__stopped.wait(self.interval)
+
+    def sample(self):
+        now = time.time()
+        for node in self.nodes():
+            if not node.pid:
+                continue
+            values = read_process(int(node.pid))
+            if values is None:
+                continue
+            key = (node.name, int(node.pid))
+            if key not in self.buffers:
+                self.buffers[key] = RingBuffer(self.capacity)
+            self.buffers[key].append((now,) + values)
+
+    def stop(self):
+        self.__stopped.set()
+        if self.is_alive():
+            self.join()
+
+    def summary(self):
+        """
+        Returns, per node: samples taken, processes sampled (more than one
+        if the node was restarted), average CPU use over the sampled windows
+        (1.0 is one core), peak RSS and RSS growth of its last process in
+        bytes, peak thread count and bytes read and written during the
+        windows. Counters are only subtracted within a process.
+        """
+        processes = {}
+        for (name, pid), samples in self.buffers.items():
+            processes.setdefault(name, []).append(samples)
+
+        result = {}
+        for name, buffers in processes.items():
+            buffers.sort(key=lambda samples: samples.column('time')[0])
+            elapsed = cpu = 0.0
+            reads = writes = 0
+            for samples in buffers:
+                times = samples.column('time')
+                elapsed += times[-1] - times[0]
+                cpu += samples.column('cpu')[-1] - samples.column('cpu')[0]
+                reads = self.__delta(samples.column('read_bytes'), reads)
+                writes = self.__delta(samples.column('write_bytes'), writes)
+            last_rss = buffers[-1].column('rss')
+            result[name] = {
+                'samples': sum(len(samples) for samples in buffers),
+                'processes': len(buffers),
+                'cpu': cpu / elapsed if elapsed > 0 else 0.0,
+                'rss_max': max(max(samples.column('rss')) for samples in buffers),
+                'rss_growth': last_rss[-1] - last_rss[0],
+                'threads_max': int(max(max(samples.column('threads')) for samples in buffers)),
+                'read_bytes': reads,
+                'write_bytes': writes,
+            }
+        return result
+
+    @staticmethod
+    def __delta(counter, total):
+        """Adds counter's growth to total, which is None once a process' counter was unreadable."""
+        if total is None or counter[0] < 0:
+            return None
+        return total + counter[-1] - counter[0]
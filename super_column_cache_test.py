@@ -3,7 +3,7 @@ from thrift_bindings.v30.ttypes import (KsDef, CfDef, Mutation, ColumnOrSuperCol
                                         ColumnParent)
 from thrift_bindings.v30.ttypes import ConsistencyLevel as ThriftConsistencyLevel
 
-from thrift_tests import get_thrift_client
+from tools import get_thrift_client
 
 from dtest import Tester
 
@@ -2,7 +2,7 @@ import time
 
 from dtest import Tester, debug
 
-from thrift_tests import get_thrift_client
+from tools import get_thrift_client
 
 from cql.cassandra.ttypes import CfDef, ColumnParent, CounterColumn, \
         ConsistencyLevel, ColumnPath
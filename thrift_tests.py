@@ -6,18 +6,24 @@ from thrift.protocol import TBinaryProtocol
 from thrift.Thrift import TApplicationException
 
 from dtest import Tester, debug, NUM_TOKENS, DISABLE_VNODES
-from tools import since
+from tools import since, get_thrift_client
 from thrift_bindings.v30 import Cassandra
 from thrift_bindings.v30.Cassandra import *
 
-def get_thrift_client(host='127.0.0.1', port=9160):
-    socket = TSocket.TSocket(host, port)
-    transport = TTransport.TFramedTransport(socket)
-    protocol = TBinaryProtocol.TBinaryProtocol(transport)
-    client = Cassandra.Client(protocol)
-    client.transport = transport
-    return client
-thrift_client = client = get_thrift_client()
+class LazyThriftClient(object):
+    """
+    The client shared by the tests of this module, built by get_thrift_client()
+    the first time one of its attributes is used rather than on import.
+    """
+    def __init__(self):
+        self.__client = None
+
+    def __getattr__(self, name):
+        if self.__client is None:
+            self.__client = get_thrift_client()
+        return getattr(self.__client, name)
+
+thrift_client = client = LazyThriftClient()
 
 pid_fname = "system_test.pid"
 def pid():
@@ -0,0 +1,167 @@
+"""
+Per-phase timing of dtest runs.
+
+When RECORD_TIMINGS is set, every Tester keeps a TestTimer that splits the
+test's wall-clock time into sequential phases (setUp, test, tearDown,
+log_scan, copy_logs, cleanup), and instrument() makes calls to slow ccm
+operations and time.sleep count towards the running test as well. One JSON
+line per test is appended to the run's timings file in the logs directory.
+
+To rank tests, phases and calls by cost:
+
+    python timings.py logs/timings-<timestamp>.jsonl [top]
+"""
+import json
+import sys
+import threading
+import time
+from collections import defaultdict
+
+try:
+    from monotonic import monotonic as clock
+except ImportError:
+    # python 2 has no monotonic clock in the standard library
+    clock = time.time
+
+# (class path, method name) of the calls timed by instrument()
+INSTRUMENTED_CALLS = [
+    ('ccmlib.cluster.Cluster', 'populate'),
+    ('ccmlib.cluster.Cluster', 'start'),
+    ('ccmlib.node.Node', 'start'),
+    ('ccmlib.node.Node', 'stress'),
+    ('ccmlib.node.Node', 'nodetool'),
+    ('ccmlib.node.Node', 'watch_log_for'),
+]
+
+_current = None
+_local = threading.local()
+
+
+class TestTimer(object):
+    """
+    Times the phases of a single test. Phases are sequential: starting one
+    ends the previous one. Calls timed by instrument() while the timer is
+    current are added to `calls` as name -> [count, seconds].
+    """
+
+    def __init__(self, test_id):
+        global _current
+        self.test_id = test_id
+        self.phases = []
+        self.calls = defaultdict(lambda: [0, 0.0])
+        self.attachments = {}
+        self.__phase = None
+        self.__phase_start = None
+        _current = self
+
+    def switch(self, phase):
+        """Ends the current phase, if any, and starts `phase`."""
+        now = clock()
+        if self.__phase is not None:
+            self.phases.append((self.__phase, now - self.__phase_start))
+        self.__phase = phase
+        self.__phase_start = now
+
+    def finish(self, path=None):
+        """Ends the last phase and appends the test's timings to `path`, if given."""
+        global _current
+        self.switch(None)
+        if _current is self:
+            _current = None
+        if path is not None:
+            with open(path, 'a') as f:
+                f.write(json.dumps(self.to_dict()) + '\n')
+
+    def attach(self, key, value):
+        """Adds a JSON-serializable value to the test's record under key."""
+        self.attachments[key] = value
+
+    def record_call(self, name, elapsed):
+        stats = self.calls[name]
+        stats[0] += 1
+        stats[1] += elapsed
+
+    def to_dict(self):
+        record = dict(self.attachments)
+        record.update({'test': self.test_id,
+                       'total': sum(elapsed for _, elapsed in self.phases),
+                       'phases': self.phases,
+                       'calls': dict(self.calls)})
+        return record
+
+
+def _timed(name, func):
+    def wrapped(*args, **kwargs):
+        # only the outermost timed call counts, node.start() waits with
+        # watch_log_for() and sleeps, which would be counted twice otherwise
+        if _current is None or getattr(_local, 'depth', 0):
+            return func(*args, **kwargs)
+        _local.depth = 1
+        start = clock()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.depth = 0
+            timer = _current
+            if timer is not None:
+                timer.record_call(name, clock() - start)
+    wrapped.__name__ = func.__name__
+    wrapped.__doc__ = func.__doc__
+    return wrapped
+
+
+def record_call(name, elapsed):
+    """Adds a call timed by its caller, rather than by instrument(), to the current test."""
+    timer = _current
+    if timer is not None:
+        timer.record_call(name, elapsed)
+
+
+_instrumented = []
+
+def instrument():
+    """Wraps INSTRUMENTED_CALLS and time.sleep so that they are timed. Idempotent."""
+    if _instrumented:
+        return
+    for class_path, method in INSTRUMENTED_CALLS:
+        module_name, class_name = class_path.rsplit('.', 1)
+        cls = getattr(__import__(module_name, fromlist=[class_name]), class_name)
+        setattr(cls, method, _timed('%s.%s' % (class_name, method), getattr(cls, method)))
+    time.sleep = _timed('time.sleep', time.sleep)
+    _instrumented.append(True)
+
+
+def load(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(records, top=20, out=sys.stdout):
+    """Prints the costliest tests, and phase and call totals over all records."""
+    phases = defaultdict(float)
+    calls = defaultdict(lambda: [0, 0.0])
+    for record in records:
+        for phase, elapsed in record['phases']:
+            phases[phase] += elapsed
+        for name, (count, elapsed) in record['calls'].items():
+            calls[name][0] += count
+            calls[name][1] += elapsed
+    total = sum(phases.values()) or 1.0
+
+    out.write("%d tests, %.1fs\n\n" % (len(records), sum(phases.values())))
+    out.write("Phases:\n")
+    for phase, elapsed in sorted(phases.items(), key=lambda item: -item[1]):
+        out.write("  %-12s %10.1fs %5.1f%%\n" % (phase, elapsed, 100 * elapsed / total))
+    out.write("\nCalls:\n")
+    for name, (count, elapsed) in sorted(calls.items(), key=lambda item: -item[1][1]):
+        out.write("  %-28s %10.1fs %7d calls\n" % (name, elapsed, count))
+    out.write("\nSlowest %d tests:\n" % top)
+    for record in sorted(records, key=lambda r: -r['total'])[:top]:
+        worst = max(record['phases'], key=lambda p: p[1]) if record['phases'] else ('-', 0)
+        out.write("  %8.1fs  %s (mostly %s: %.1fs)\n" % (record['total'], record['test'], worst[0], worst[1]))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit("usage: python timings.py <timings.jsonl> [top]")
+    summarize(load(sys.argv[1]), top=int(sys.argv[2]) if len(sys.argv) > 2 else 20)
@@ -2,12 +2,26 @@ from ccmlib.node import Node
 from decorator  import decorator
 from distutils.version import LooseVersion
 from threading import Thread
-import re, os, sys, fileinput, time, unittest, functools
+import re, os, sys, fileinput, time, unittest, functools, weakref
 
 from cassandra import ConsistencyLevel
-from cassandra.query import SimpleStatement
+from cassandra.query import SimpleStatement, BoundStatement
 
-from dtest import Tester, DISABLE_VNODES
+from dtest import Tester, DISABLE_VNODES, NO_SKIP, IP_PREFIX, slot_port, retry_till_success, cassandra_version, version_info
+from datahelp import execute_bounded
+
+def get_thrift_client(host='127.0.0.1', port=9160):
+    # the generated bindings are big, only load them for tests that use thrift
+    from thrift.transport import TTransport, TSocket
+    from thrift.protocol import TBinaryProtocol
+    from thrift_bindings.v30 import Cassandra
+
+    socket = TSocket.TSocket(host, port)
+    transport = TTransport.TFramedTransport(socket)
+    protocol = TBinaryProtocol.TBinaryProtocol(transport)
+    client = Cassandra.Client(protocol)
+    client.transport = transport
+    return client
 
 def rows_to_list(rows):
     new_list = [list(row) for row in rows]
@@ -31,23 +45,101 @@ def query_c1c2(session, key, consistency=ConsistencyLevel.QUORUM, tolerate_missi
 # work for cluster started by populate
 def new_node(cluster, bootstrap=True, token=None, remote_debug_port='2000', data_center=None):
     i = len(cluster.nodes) + 1
+    ip = '%s%s' % (IP_PREFIX, i)
     node = Node('node%s' % i,
                 cluster,
                 bootstrap,
-                ('127.0.0.%s' % i, 9160),
-                ('127.0.0.%s' % i, 7000),
-                str(7000 + i * 100),
-                remote_debug_port,
+                (ip, 9160),
+                (ip, 7000),
+                slot_port(7000 + i * 100),
+                slot_port(remote_debug_port),
                 token,
-                binary_interface=('127.0.0.%s' % i, 9042))
+                binary_interface=(ip, 9042))
     cluster.add(node, not bootstrap, data_center=data_center)
     return node
 
-def insert_columns(tester, session, key, columns_count, consistency=ConsistencyLevel.QUORUM, offset=0):
-    upds = [ "UPDATE cf SET v=\'value%d\' WHERE key=\'k%s\' AND c=\'c%06d\'" % (i, key, i) for i in xrange(offset*columns_count, columns_count*(offset+1))]
-    query = 'BEGIN BATCH %s; APPLY BATCH' % '; '.join(upds)
-    simple_query = SimpleStatement(query, consistency_level=consistency)
-    session.execute(simple_query)
+def start_nodes(nodes, wait_for_binary_proto=True, wait_other_notice=True, timeout=120, **kwargs):
+    """
+    Starts all of `nodes` together and waits until they are ready, which takes
+    about as long as the slowest node instead of the sum of all of them.
+
+    Seeds among `nodes` are launched first and the others only once the seeds'
+    messaging service is up, so non-seed nodes always find a seed to gossip with.
+    Readiness is then awaited for every node in parallel: the native transport
+    is listening (if `wait_for_binary_proto`) and every other running node of
+    the cluster has logged it as UP (if `wait_other_notice`).
+
+    Extra keyword arguments, like use_jna, are passed to Node.start().
+    """
+    nodes = list(nodes)
+    if not nodes:
+        return
+    cluster = nodes[0].cluster
+    marks = dict((node.name, node.mark_log()) for node in cluster.nodelist())
+
+    seeds = [node for node in nodes if node in cluster.seeds]
+    others = [node for node in nodes if node not in seeds]
+    for node in seeds:
+        node.start(wait_other_notice=False, wait_for_binary_proto=False, **kwargs)
+    if seeds and others:
+        for node in seeds:
+            node.watch_log_for("Starting Messaging Service", from_mark=marks[node.name], timeout=timeout)
+    for node in others:
+        node.start(wait_other_notice=False, wait_for_binary_proto=False, **kwargs)
+
+    errors = []
+
+    def wait_until_ready(node):
+        try:
+            if wait_for_binary_proto:
+                node.watch_log_for("Starting listening for CQL clients", from_mark=marks[node.name], timeout=timeout)
+            if wait_other_notice:
+                for peer in cluster.nodelist():
+                    if peer is not node and peer.is_running():
+                        peer.watch_log_for_alive(node, from_mark=marks[peer.name], timeout=timeout)
+        except Exception as e:
+            errors.append(e)
+
+    waiters = [Thread(target=wait_until_ready, args=(node,)) for node in nodes]
+    for waiter in waiters:
+        waiter.start()
+    for waiter in waiters:
+        waiter.join()
+    if errors:
+        raise errors[0]
+
+# default number of writes bulk_write() keeps in flight
+BULK_IN_FLIGHT = 100
+
+# session -> {(keyspace, query): prepared statement}, dropped with the session
+_prepared_statements = weakref.WeakKeyDictionary()
+
+def prepare_cached(session, query):
+    """
+    Returns query prepared on session, preparing it only the first time it
+    is asked for on that session and keyspace. The statement is shared by
+    every caller: bind it rather than changing its settings.
+    """
+    statements = _prepared_statements.setdefault(session, {})
+    key = (session.keyspace, query)
+    if key not in statements:
+        statements[key] = session.prepare(query)
+    return statements[key]
+
+def bulk_write(session, query, parameters, consistency=ConsistencyLevel.QUORUM, in_flight=BULK_IN_FLIGHT):
+    """
+    Prepares query once per session and executes it with each tuple of
+    values in parameters, which can be a generator, keeping at most
+    in_flight writes outstanding. Returns when every write is acknowledged,
+    and raises the first error, if any.
+    """
+    prepared = prepare_cached(session, query)
+    statements = ((BoundStatement(prepared, consistency_level=consistency).bind(values), None) for values in parameters)
+    execute_bounded(session, statements, concurrency=in_flight)
+
+def insert_columns(tester, session, key, columns_count, consistency=ConsistencyLevel.QUORUM, offset=0, in_flight=BULK_IN_FLIGHT):
+    values = (('value%d' % i, 'k%s' % key, 'c%06d' % i) for i in xrange(offset*columns_count, columns_count*(offset+1)))
+    bulk_write(session, "UPDATE cf SET v=? WHERE key=? AND c=?", values, consistency, in_flight)
 
 def query_columns(tester, cursor, key, columns_count, consistency=ConsistencyLevel.QUORUM, offset=0):
     query = SimpleStatement('SELECT c, v FROM cf WHERE key=\'k%s\' AND c >= \'c%06d\' AND c <= \'c%06d\'' % (key, offset, columns_count+offset-1), consistency_level=consistency)
@@ -56,21 +148,6 @@ def query_columns(tester, cursor, key, columns_count, consistency=ConsistencyLev
     for i in xrange(0, columns_count):
         assert res[i][1] == 'value%d' % (i+offset)
 
-def retry_till_success(fun, *args, **kwargs):
-    timeout = kwargs.pop('timeout', 60)
-    bypassed_exception = kwargs.pop('bypassed_exception', Exception)
-
-    deadline = time.time() + timeout
-    while True:
-        try:
-            return fun(*args, **kwargs)
-        except bypassed_exception:
-            if time.time() > deadline:
-                raise
-            else:
-                # brief pause before next attempt
-                time.sleep(0.25)
-
 # Simple puts and get (on one row), testing both reads by names and by slice,
 # with overwrites and flushes between inserts to make sure we hit multiple
 # sstables on reads
@@ -91,25 +168,12 @@ def putget(cluster, cursor, cl=ConsistencyLevel.QUORUM):
     rows = cursor.execute(query)
     _validate_row(cluster, rows)
 
-def _put_with_overwrite(cluster, cursor, nb_keys, cl=ConsistencyLevel.QUORUM):
-    for k in xrange(0, nb_keys):
-        kvs = [ "UPDATE cf SET v=\'value%d\' WHERE key=\'k%s\' AND c=\'c%02d\'" % (i, k, i) for i in xrange(0, 100) ]
-        query = SimpleStatement('BEGIN BATCH %s APPLY BATCH' % '; '.join(kvs), consistency_level=cl)
-        cursor.execute(query)
-        time.sleep(.01)
-    cluster.flush()
-    for k in xrange(0, nb_keys):
-        kvs = [ "UPDATE cf SET v=\'value%d\' WHERE key=\'k%s\' AND c=\'c%02d\'" % (i*4, k, i*2) for i in xrange(0, 50) ]
-        query = SimpleStatement('BEGIN BATCH %s APPLY BATCH' % '; '.join(kvs), consistency_level=cl)
-        cursor.execute(query)
-        time.sleep(.01)
-    cluster.flush()
-    for k in xrange(0, nb_keys):
-        kvs = [ "UPDATE cf SET v=\'value%d\' WHERE key=\'k%s\' AND c=\'c%02d\'" % (i*20, k, i*5) for i in xrange(0, 20) ]
-        query = SimpleStatement('BEGIN BATCH %s APPLY BATCH' % '; '.join(kvs), consistency_level=cl)
-        cursor.execute(query)
-        time.sleep(.01)
-    cluster.flush()
+def _put_with_overwrite(cluster, cursor, nb_keys, cl=ConsistencyLevel.QUORUM, in_flight=BULK_IN_FLIGHT):
+    # each pass overwrites part of the previous one, and is flushed to its own sstable
+    for count, value_step, column_step in ((100, 1, 1), (50, 4, 2), (20, 20, 5)):
+        values = (('value%d' % (i*value_step), 'k%s' % k, 'c%02d' % (i*column_step)) for k in xrange(0, nb_keys) for i in xrange(0, count))
+        bulk_write(cursor, "UPDATE cf SET v=? WHERE key=? AND c=?", values, cl, in_flight)
+        cluster.flush()
 
 def _validate_row(cluster, res):
     assert len(res) == 100, len(res)
@@ -154,6 +218,16 @@ def replace_in_file(filepath, search_replacements):
 
 
 class since(object):
+    """
+    Skips the decorated test or test class unless the Cassandra version is at
+    least `cass_version` (and at most `max_version`, if given).
+
+    When the version can be known before any cluster is built (see
+    dtest.cassandra_version), the skip is decided at decoration time and
+    unittest skips the test before setUp runs. Otherwise it is checked
+    against the test cluster once setUp has created it.
+    """
+
     def __init__(self, cass_version, max_version=None):
         self.cass_version = LooseVersion(cass_version)
         self.max_version = max_version
@@ -172,7 +246,7 @@ class since(object):
         @functools.wraps(cls.setUp)
         def wrapped(obj):
             getattr(obj, backup_setUp_name)()
-            version = LooseVersion(obj.cluster.version())
+            version = version_info(obj.cluster).version
             msg = self._skip_msg(version)
             if msg:
                 obj.skip(msg)
@@ -184,7 +258,7 @@ class since(object):
     def _wrap_function(self, f):
         @functools.wraps(f)
         def wrapped(obj):
-            version = LooseVersion(obj.cluster.version())
+            version = version_info(obj.cluster).version
             msg = self._skip_msg(version)
             if msg:
                 obj.skip(msg)
@@ -192,6 +266,11 @@ class since(object):
         return wrapped
 
     def __call__(self, skippable):
+        version = cassandra_version()
+        if version is not None and not NO_SKIP:
+            msg = self._skip_msg(version)
+            if msg:
+                return unittest.skip(msg)(skippable)
         if isinstance(skippable, type):
             return self._wrap_setUp(skippable)
         return self._wrap_function(skippable)
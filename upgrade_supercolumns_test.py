@@ -8,10 +8,8 @@ from thrift_bindings.v30.ttypes import (KsDef, CfDef, Mutation, ColumnOrSuperCol
                                         ColumnParent, CounterColumn)
 from thrift_bindings.v30.ttypes import ConsistencyLevel as ThriftConsistencyLevel
 
-from thrift_tests import get_thrift_client
-
 from dtest import Tester, debug
-from tools import since
+from tools import since, get_thrift_client
 
 
 @since('2.0')
@@ -9,8 +9,9 @@ import uuid
 
 from collections import defaultdict
 from distutils.version import LooseVersion
+from nose.exc import SkipTest
 from dtest import Tester, debug, DISABLE_VNODES, DEFAULT_DIR
-from tools import new_node
+from tools import new_node, start_nodes
 from ccmlib import common as ccmcommon
 import tarfile
 from cassandra import ConsistencyLevel, WriteTimeout
@@ -40,29 +41,42 @@ if LOCAL_MODE:
 else:
     REPO_LOCATION = "https://git-wip-us.apache.org/repos/asf/cassandra.git"
 
-# lets cache this once so we don't make a bunch of remote requests
-GIT_LS = subprocess.check_output(["git", "ls-remote", "-h", "-t", REPO_LOCATION]).rstrip()
+# maps ref type (branch, tags) to ref names and sha's, see git_refs()
+MAPPED_REFS = None
 
-# maps ref type (branch, tags) to ref names and sha's
-MAPPED_REFS = defaultdict(dict)
-for row in GIT_LS.split('\n'):
-    sha, _fullref = row.split('\t')
-    _, ref_type, ref = _fullref.split('/')
-    MAPPED_REFS[ref_type][ref.split('^')[0]] = sha
 
-# We often want this post-mortem when debugging may have been disabled, so print/pprint is intentional here
-print("************************************* GIT REFS USED FOR THIS TEST RUN *********************************************")
-print("************************** KEEP IN MIND THAT A SHA MAY POINT TO ANOTHER COMMIT SHA! *******************************")
-for ref_type in MAPPED_REFS.keys():
-    print("Git refs for {}:").format(ref_type.upper())
-    pprint.pprint(MAPPED_REFS[ref_type], indent=4)
+def git_refs():
+    """
+    Lists the refs of REPO_LOCATION, once, the first time a test needs them.
+    Importing (or collecting) this module doesn't go to the remote repo.
+    """
+    global MAPPED_REFS
+    if MAPPED_REFS is not None:
+        return MAPPED_REFS
+
+    git_ls = subprocess.check_output(["git", "ls-remote", "-h", "-t", REPO_LOCATION]).rstrip()
+    mapped_refs = defaultdict(dict)
+    for row in git_ls.split('\n'):
+        sha, _fullref = row.split('\t')
+        _, ref_type, ref = _fullref.split('/')
+        mapped_refs[ref_type][ref.split('^')[0]] = sha
 
-if os.environ.get('CASSANDRA_VERSION'):
-    debug('CASSANDRA_VERSION is not used by upgrade tests!')
+    # We often want this post-mortem when debugging may have been disabled, so print/pprint is intentional here
+    print("************************************* GIT REFS USED FOR THIS TEST RUN *********************************************")
+    print("************************** KEEP IN MIND THAT A SHA MAY POINT TO ANOTHER COMMIT SHA! *******************************")
+    for ref_type in mapped_refs.keys():
+        print("Git refs for {}:").format(ref_type.upper())
+        pprint.pprint(mapped_refs[ref_type], indent=4)
+
+    if os.environ.get('CASSANDRA_VERSION'):
+        debug('CASSANDRA_VERSION is not used by upgrade tests!')
+
+    MAPPED_REFS = mapped_refs
+    return MAPPED_REFS
 
 
 def sha_for_ref_name(ref_name, ref_type='tags'):
-    return MAPPED_REFS[ref_type][ref_name]
+    return git_refs()[ref_type][ref_name]
 
 
 class GitSemVer(object):
@@ -92,7 +106,7 @@ def latest_tag_matching(ver_tuple):
     # step through each tag found in the git repo
     # check if the tag is a match for the base version provided in ver_tuple
     # if it's a match add it to wrappers and when we complete this process give back the latest version found
-    for t in MAPPED_REFS['tags'].keys():
+    for t in git_refs()['tags'].keys():
         # let's short circuit if the tag we are checking matches the cassandra-x.y.z format, otherwise make another attempt for x.y.z-foo in case it's something line 1.2.3-tentative
         match = re.match('^cassandra-({ver_str}\.\d+(-+\w+)*)$'.format(ver_str=ver_str), t) or re.match('^({ver_str}\.\d*(-+\w+)*)$'.format(ver_str=ver_str), t)
         if match:
@@ -180,7 +194,7 @@ class TestUpgradeThroughVersions(Tester):
             # Start with 3 node cluster
             debug('Creating cluster (%s)' % self.test_versions[0])
             cluster.populate(3)
-            [node.start(use_jna=True) for node in cluster.nodelist()]
+            start_nodes(cluster.nodelist(), use_jna=True)
         else:
             debug("Skipping cluster creation (should already be built)")
 
@@ -273,7 +287,8 @@ class TestUpgradeThroughVersions(Tester):
             debug('Starting %s on new version (%s)' % (node.name, tag))
             # Setup log4j / logback again (necessary moving from 2.0 -> 2.1):
             node.set_log_level("INFO")
-            node.start(wait_other_notice=True)
+        start_nodes(nodes, wait_for_binary_proto=False)
+        for node in nodes:
             node.nodetool('upgradesstables -a')
 
     def _log_current_ver(self, current_tag):
@@ -404,10 +419,26 @@ class PointToPointUpgradeBase(TestUpgradeThroughVersions):
     place to add functionality/tests for those subclasses to run.
 
     __test__ is False for this class. Subclasses need to revert to True to run tests!
+
+    Subclasses set version_specs: branch names, or version tuples standing for
+    the latest tag matching that version, which is looked up when the test runs.
     """
     __test__ = False
+    version_specs = None
+
+    @property
+    def test_versions(self):
+        return [latest_tag_matching(v) if isinstance(v, tuple) else v for v in self.version_specs]
 
     def setUp(self):
+        versions = self.test_versions
+        for spec, version in zip(self.version_specs, versions):
+            if version is None:
+                # in some cases we might not find a tag (like when the to_branch is trunk)
+                raise SkipTest('No tag matching %s' % make_ver_str(spec))
+            if isinstance(spec, tuple):
+                debug('Latest tag matching {}: {} ({})'.format(make_ver_str(spec), version, sha_for_ref_name(version)))
+
         if LOCAL_MODE:
             self._init_local(self.test_versions[0])
         else:
@@ -446,7 +477,7 @@ class PointToPointUpgradeBase(TestUpgradeThroughVersions):
         # try and add a new node
         # multi dc, 2 nodes in each dc
         self.cluster.populate([2, 2])
-        [node.start(use_jna=True) for node in self.cluster.nodelist()]
+        start_nodes(self.cluster.nodelist(), use_jna=True)
         self._multidc_schema_create()
         self.upgrade_scenario(populate=False, create_schema=False, after_upgrade_call=(self._bootstrap_new_node_multidc,))
 
@@ -483,12 +514,10 @@ for from_ver in UPGRADE_PATH:
     # and trunk is the final version, so there's no test where trunk is upgraded to something else
     if make_ver_str(from_ver) >= '1.2' and from_ver != TRUNK_VER:
         cls_name = ('TestUpgrade_from_' + make_ver_str(from_ver) + '_latest_tag_to_' + make_ver_str(from_ver) + '_HEAD').replace('-', '_').replace('.', '_')
-        start_ver_latest_tag = latest_tag_matching(from_ver)
-        debug('Creating test upgrade class: {} with start tag of: {} ({})'.format(cls_name, start_ver_latest_tag, sha_for_ref_name(start_ver_latest_tag)))
         vars()[cls_name] = type(
             cls_name,
             (PointToPointUpgradeBase,),
-            {'test_versions': [start_ver_latest_tag, make_branch_str(from_ver)], '__test__': True})
+            {'version_specs': [from_ver, make_branch_str(from_ver)], '__test__': True})
 
 # build a list of tuples like so:
 # [(A, B), (B, C) ... ]
@@ -504,33 +533,25 @@ for i, _ in enumerate(points):
 # create test classes for upgrading from latest tag on one branch, to head of the next branch (see comment above)
 for (from_ver, to_branch) in POINT_UPGRADES:
     cls_name = ('TestUpgrade_from_' + make_ver_str(from_ver) + '_latest_tag_to_' + make_branch_str(to_branch) + '_HEAD').replace('-', '_').replace('.', '_')
-    from_ver_latest_tag = latest_tag_matching(from_ver)
-    debug('Creating test upgrade class: {} with start tag of: {} ({})'.format(cls_name, from_ver_latest_tag, sha_for_ref_name(from_ver_latest_tag)))
     vars()[cls_name] = type(
         cls_name,
         (PointToPointUpgradeBase,),
-        {'test_versions': [from_ver_latest_tag, make_branch_str(to_branch)], '__test__': True})
+        {'version_specs': [from_ver, make_branch_str(to_branch)], '__test__': True})
 
 # create test classes for upgrading from HEAD of one branch to HEAD of next.
 for (from_branch, to_branch) in POINT_UPGRADES:
     cls_name = ('TestUpgrade_from_' + make_branch_str(from_branch) + '_HEAD_to_' + make_branch_str(to_branch) + '_HEAD').replace('-', '_').replace('.', '_')
-    debug('Creating test upgrade class: {}'.format(cls_name))
     vars()[cls_name] = type(
         cls_name,
         (PointToPointUpgradeBase,),
-        {'test_versions': [make_branch_str(from_branch), make_branch_str(to_branch)], '__test__': True})
+        {'version_specs': [make_branch_str(from_branch), make_branch_str(to_branch)], '__test__': True})
 
 # create test classes for upgrading from HEAD of one branch, to latest tag of next branch
 for (from_branch, to_branch) in POINT_UPGRADES:
     cls_name = ('TestUpgrade_from_' + make_branch_str(from_branch) + '_HEAD_to_' + make_branch_str(to_branch) + '_latest_tag').replace('-', '_').replace('.', '_')
-    to_ver_latest_tag = latest_tag_matching(to_branch)
-    # in some cases we might not find a tag (like when the to_branch is trunk)
-    # so these will be skipped.
-    if to_ver_latest_tag is None:
-        continue
-    debug('Creating test upgrade class: {} with end tag of: {} ({})'.format(cls_name, to_ver_latest_tag, sha_for_ref_name(to_ver_latest_tag)))
-
+    # the end tag is looked up when the test runs, which is skipped if there
+    # is no tag for to_branch yet (like when the to_branch is trunk)
     vars()[cls_name] = type(
         cls_name,
         (PointToPointUpgradeBase,),
-        {'test_versions': [make_branch_str(from_branch), to_ver_latest_tag], '__test__': True})
+        {'version_specs': [make_branch_str(from_branch), to_branch], '__test__': True})